@@ -2,7 +2,9 @@ from flask import Flask, request, abort
 import json
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from jwks import JWKSCache, JWKSUnavailable, url_fetcher
+from token_cache import TokenCache
 
 
 app = Flask(__name__)
@@ -11,6 +13,9 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+jwks_cache = JWKSCache(url_fetcher(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+token_cache = TokenCache(maxsize=1024)
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -52,8 +57,6 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
     if 'kid' not in unverified_header:
@@ -62,15 +65,21 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    try:
+        key = jwks_cache.get_key(unverified_header['kid'])
+    except JWKSUnavailable:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 401)
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -109,10 +118,13 @@ def requires_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = verify_decode_jwt(token)
+            except:
+                abort(401)
+            token_cache.put(token, payload)
         return f(payload, *args, **kwargs)
 
     return wrapper
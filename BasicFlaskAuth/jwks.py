@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+'''
+url_fetcher(url)
+    returns a fetcher that downloads a JWKS document over HTTPS
+    this is the default fetcher used against Auth0 /.well-known/jwks.json
+'''
+def url_fetcher(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+'''
+file_fetcher(path)
+    returns a fetcher that reads a JWKS document from a local file
+    useful for tests and for offline development
+'''
+def file_fetcher(path):
+    def fetch():
+        with open(path) as jwks_file:
+            return json.load(jwks_file)
+    return fetch
+
+
+'''
+JWKSUnavailable
+    raised by JWKSCache when the key set is needed and cannot be fetched
+    (network error, bad JSON, ...), the original error is its __cause__
+'''
+class JWKSUnavailable(Exception):
+    pass
+
+
+'''
+JWKSCache
+a process-wide store of signing keys indexed by key id (kid)
+
+    fetcher: callable returning a JWKS document ({'keys': [...]})
+    ttl: seconds a fetched key set is considered fresh
+    min_refresh_interval: minimum number of seconds between two refreshes
+        triggered by an unknown kid, so forged kids cannot hammer Auth0
+    retry_interval: seconds during which lookups that need keys fail fast
+        with JWKSUnavailable after a failed fetch, instead of every
+        request fetching again while Auth0 is down
+
+    once the key set is older than ttl, lookups keep answering from the
+    stale keys while a single background thread refreshes them
+    (stale-while-revalidate), so the auth path never blocks on the network
+    except for the very first fetch and for genuinely unknown kids
+    fetches happen under a lock and re-check the keys once they hold it, so
+    requests waiting on a fetch use its result rather than fetching again
+
+    this module is copied as is into BasicFlaskAuth/jwks.py, keep the two
+    files identical
+'''
+class JWKSCache:
+    def __init__(self, fetcher, ttl=3600, min_refresh_interval=60, retry_interval=5, clock=time.monotonic):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.fetches = 0
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    '''
+    get_key(kid)
+        returns the JWK for kid or None if the issuer does not know it
+        raises JWKSUnavailable when no key set could be fetched yet
+    '''
+    def get_key(self, kid):
+        if self._fetched_at is None:
+            with self._lock:
+                if self._fetched_at is None:
+                    self._fetch()
+        elif self.clock() - self._fetched_at > self.ttl:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._may_refresh():
+            with self._lock:
+                # keys may have been rotated since the last fetch, unless
+                # another request fetched them while this one waited
+                key = self._keys.get(kid)
+                if key is None and self._may_refresh():
+                    try:
+                        self._fetch()
+                    except JWKSUnavailable:
+                        # answer from the keys we have
+                        pass
+                    key = self._keys.get(kid)
+        return key
+
+    '''
+    refresh()
+        synchronously fetches the key set and swaps it in
+        on failure the previous keys are kept and JWKSUnavailable is raised
+    '''
+    def refresh(self):
+        with self._lock:
+            self._fetch()
+
+    '''
+    clear()
+        drops every cached key, the next lookup fetches again
+    '''
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
+            self._failed_at = None
+
+    def _fetch(self):
+        # called with the lock held
+        if self._failed_at is not None and self.clock() - self._failed_at < self.retry_interval:
+            raise JWKSUnavailable('the last fetch of the key set failed, retrying later')
+        self._last_attempt = self.clock()
+        try:
+            jwks = self.fetcher()
+            keys = {key['kid']: key for key in jwks.get('keys', []) if 'kid' in key}
+        except Exception as error:
+            self._failed_at = self.clock()
+            raise JWKSUnavailable(f'unable to fetch the key set: {error}') from error
+        self.fetches += 1
+        self._keys = keys
+        self._fetched_at = self.clock()
+        self._failed_at = None
+
+    def _may_refresh(self):
+        last_attempt = self._last_attempt
+        return last_attempt is None or self.clock() - last_attempt >= self.min_refresh_interval
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or not self._may_refresh():
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._background_refresh, daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                # a lookup of an unknown kid may have refreshed them already
+                fetched_at = self._fetched_at
+                if fetched_at is None or self.clock() - fetched_at > self.ttl:
+                    self._fetch()
+        except JWKSUnavailable:
+            # keep serving the stale keys, the next lookup past
+            # min_refresh_interval will try again
+            pass
+        finally:
+            self._refreshing = False
@@ -0,0 +1,130 @@
+'''
+bench_bookings
+    imports --count shows (1,000,000 by default) through bulk.import_records
+    with booking conflict checks on, at --venues venues by --artists artists,
+    and reports rows/s, the double bookings rejected and the peak memory;
+    then times bookings.find_conflicts() for a venue with 1,000, 10,000 and
+    100,000 shows, which should stay about flat (O(log n))
+
+    runs against a new SQLite file by default; --database-url takes a
+    migrated scratch database (rows are added to it, not removed)
+
+    USAGE (from the starter_code directory)
+      python -m benchmarks.bench_bookings
+      python -m benchmarks.bench_bookings --count 100000 --database-url postgresql://localhost/fyyur_bench
+'''
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+START = datetime(2030, 1, 1, 18, 0)
+SLOT = timedelta(hours=3)
+SIZES = (1000, 10000, 100000)
+CHECKS = 2000
+
+
+def show_records(count, venues, artists, seed):
+  # every venue gets a show per 3 hour slot, give or take half an hour, with a
+  # random artist: the artist is sometimes booked elsewhere at that time
+  rng = random.Random(seed)
+  for number in range(1, count + 1):
+    slot = (number - 1) // venues
+    start_time = START + slot * SLOT + timedelta(minutes=rng.randrange(-30, 30))
+    yield number, {'venue_id': str((number - 1) % venues + 1),
+                   'artist_id': str(rng.randrange(artists) + 1),
+                   'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}, None
+
+
+def add_owners(models, venues, artists):
+  db = models.db
+  first_venue = (db.session.query(db.func.max(models.Venue.id)).scalar() or 0) + 1
+  first_artist = (db.session.query(db.func.max(models.Artist.id)).scalar() or 0) + 1
+  db.session.bulk_insert_mappings(models.Venue, [
+    {'id': first_venue + n, 'name': 'Venue {}'.format(n), 'city': 'Springfield', 'state': 'CA'}
+    for n in range(venues + len(SIZES))])
+  db.session.bulk_insert_mappings(models.Artist, [
+    {'id': first_artist + n, 'name': 'Artist {}'.format(n)} for n in range(artists)])
+  db.session.commit()
+  return first_venue, first_artist
+
+
+def peak_rss_mb():
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check_latency(models, bookings, venue_id, artist_id, size, seed):
+  # size back to back shows at venue_id, then the mean time of a check at
+  # a random time among them, once the venue is loaded
+  db = models.db
+  for start in range(0, size, 10000):
+    db.session.bulk_insert_mappings(models.Show, [
+      {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': START + n * SLOT,
+       'end_time': START + n * SLOT + models.SHOW_LENGTH}
+      for n in range(start, min(size, start + 10000))])
+  db.session.commit()
+  models.notify_changes({('Venue', venue_id), ('Artist', artist_id)})
+  rng = random.Random(seed)
+  times = [START + rng.randrange(size) * SLOT + timedelta(minutes=30) for _ in range(CHECKS)]
+  bookings.find_conflicts(venue_id, 0, times[0])
+  started = time.perf_counter()
+  for start_time in times:
+    assert bookings.find_conflicts(venue_id, 0, start_time)
+  return (time.perf_counter() - started) / CHECKS
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--count', type=int, default=1000000)
+  parser.add_argument('--venues', type=int, default=1000)
+  parser.add_argument('--artists', type=int, default=5000)
+  parser.add_argument('--batch-size', type=int, default=1000)
+  parser.add_argument('--database-url')
+  parser.add_argument('--seed', type=int, default=1)
+  args = parser.parse_args()
+
+  path = None
+  if not args.database_url:
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+  os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + path
+  # imported once the database is chosen, config.py reads DATABASE_URL
+  from app import app
+  import bookings
+  import bulk
+  import models
+
+  try:
+    with app.app_context():
+      if path:
+        models.db.create_all()
+      first_venue, first_artist = add_owners(models, args.venues, args.artists)
+      # ids of the generated rows, past the rows already in the database
+      records = ((number, dict(row, venue_id=str(int(row['venue_id']) + first_venue - 1),
+                               artist_id=str(int(row['artist_id']) + first_artist - 1)), errors)
+                 for number, row, errors in show_records(args.count, args.venues, args.artists, args.seed))
+
+      def progress(report):
+        print('  {:>9,} rows  {:>7,.0f} rows/s  {:>6.0f} MB'.format(report.read, report.rate, peak_rss_mb()))
+
+      print('{} ({:,} shows, {:,} venues, {:,} artists)'.format(
+        models.db.engine.dialect.name, args.count, args.venues, args.artists))
+      report = bulk.import_records(bulk.KINDS['shows'], records, args.batch_size, progress=progress)
+      print(report.summary())
+      print('double bookings rejected: {:,}, peak RSS {:.0f} MB'.format(report.rejected, peak_rss_mb()))
+
+      print('find_conflicts() for one venue')
+      for n, size in enumerate(SIZES):
+        venue_id = first_venue + args.venues + n
+        seconds = check_latency(models, bookings, venue_id, first_artist, size, args.seed)
+        print('  {:>7,} shows  {:>8.1f} us/check'.format(size, seconds * 1e6))
+  finally:
+    if path:
+      os.unlink(path)
+
+
+if __name__ == '__main__':
+  main()
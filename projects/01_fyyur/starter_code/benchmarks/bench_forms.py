@@ -0,0 +1,134 @@
+'''
+bench_forms
+    measures how many forms are built and validated per second, for a
+    valid and an invalid submission of each form:
+      form      Form(formdata) and validate() in a request, as the
+                create and edit views do (CSRF off)
+      schema    forms.validate_data(), the path of bulk imports and JSON
+                bodies, without a form or a request
+    every case runs for --seconds, the best of --repeat runs is reported
+
+    --baseline builds the forms of forms.py at another git revision (form
+    path only), to compare before and after a change
+
+    USAGE (from the starter_code directory)
+      python -m benchmarks.bench_forms
+      python -m benchmarks.bench_forms --baseline HEAD~1
+'''
+import argparse
+import os
+import subprocess
+import time
+import types
+import warnings
+
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+import forms
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VENUE = [('name', 'The Musical Hop'), ('city', 'San Francisco'), ('state', 'CA'),
+         ('address', '1015 Folsom Street'), ('phone', '123-123-1234'),
+         ('genres', 'Jazz'), ('genres', 'Reggae'), ('genres', 'Folk'),
+         ('facebook_link', 'https://www.facebook.com/TheMusicalHop')]
+ARTIST = [('name', 'Guns N Petals'), ('city', 'San Francisco'), ('state', 'CA'),
+          ('phone', '326-123-5000'), ('genres', 'Rock n Roll'),
+          ('facebook_link', 'https://www.facebook.com/GunsNPetals')]
+SHOW = [('artist_id', '4'), ('venue_id', '1'), ('start_time', '2035-04-01 20:00:00')]
+INVALID_VENUE = [('name', ''), ('city', 'San Francisco'), ('state', 'ZZ'),
+                 ('genres', 'Jazz'), ('genres', 'Polka'), ('facebook_link', 'not a url')]
+
+CASES = (
+  ('VenueForm', VENUE),
+  ('ArtistForm', ARTIST),
+  ('ShowForm', SHOW),
+  ('VenueForm', INVALID_VENUE),
+)
+
+
+def rate(run, seconds, repeat):
+  # best number of calls per second of repeat runs of about seconds each
+  best = 0.0
+  for _ in range(repeat):
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+      for _ in range(100):
+        run()
+      calls += 100
+      now = time.perf_counter()
+      if now >= deadline:
+        break
+    best = max(best, calls / (now - started))
+  return best
+
+
+def form_path(form_class, data):
+  formdata = MultiDict(data)
+  def run():
+    form_class(formdata).validate()
+  return run
+
+
+def schema_path(module, form_class, data):
+  formdata = MultiDict(data)
+  def run():
+    module.validate_data(form_class, formdata)
+  return run
+
+
+def load_forms(revision):
+  # forms.py of revision as a module, without touching the work tree
+  prefix = subprocess.check_output(['git', 'rev-parse', '--show-prefix'], cwd=APP_DIR).decode().strip()
+  source = subprocess.check_output(['git', 'show', '{}:{}forms.py'.format(revision, prefix)], cwd=APP_DIR)
+  module = types.ModuleType('forms_' + revision.replace('~', '_'))
+  exec(compile(source, 'forms.py@' + revision, 'exec'), module.__dict__)
+  return module
+
+
+def measure(module, seconds, repeat):
+  results = []
+  for name, data in CASES:
+    form_class = getattr(module, name)
+    label = '{}{}'.format(name, '' if data is not INVALID_VENUE else ' (invalid)')
+    row = {'case': label, 'form': rate(form_path(form_class, data), seconds, repeat)}
+    if hasattr(module, 'validate_data'):
+      row['schema'] = rate(schema_path(module, form_class, data), seconds, repeat)
+    results.append(row)
+  return results
+
+
+def report(title, results):
+  print(title)
+  for row in results:
+    print('  {:<22} {}'.format(row['case'], '  '.join(
+      '{} {:>9,.0f}/s'.format(path, row[path]) for path in ('form', 'schema') if path in row)))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--seconds', type=float, default=1.0)
+  parser.add_argument('--repeat', type=int, default=3)
+  parser.add_argument('--baseline', help='git revision to compare against')
+  args = parser.parse_args()
+
+  # flask_wtf.Form is the deprecated name of FlaskForm, used by forms.py
+  warnings.simplefilter('ignore')
+  app = Flask(__name__)
+  app.config.update(SECRET_KEY='bench', WTF_CSRF_ENABLED=False)
+  with app.test_request_context('/', method='POST'):
+    current = measure(forms, args.seconds, args.repeat)
+    report('current', current)
+    if args.baseline:
+      baseline = measure(load_forms(args.baseline), args.seconds, args.repeat)
+      report(args.baseline, baseline)
+      print('speedup (form)')
+      for now, before in zip(current, baseline):
+        print('  {:<22} {:>6.2f}x'.format(now['case'], now['form'] / before['form']))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,336 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import random
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import and_, false, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, on_change, Show, SHOW_LENGTH
+
+#----------------------------------------------------------------------------#
+# Interval tree.
+#----------------------------------------------------------------------------#
+
+class _Node:
+  __slots__ = ('start', 'end', 'key', 'priority', 'max_end', 'left', 'right')
+
+  def __init__(self, start, end, key, priority):
+    self.start = start
+    self.end = end
+    self.key = key
+    self.priority = priority
+    self.max_end = end
+    self.left = None
+    self.right = None
+
+def _update(node):
+  node.max_end = node.end
+  if node.left is not None and node.left.max_end > node.max_end:
+    node.max_end = node.left.max_end
+  if node.right is not None and node.right.max_end > node.max_end:
+    node.max_end = node.right.max_end
+
+def _rotate_right(node):
+  top = node.left
+  node.left, top.right = top.right, node
+  _update(node)
+  _update(top)
+  return top
+
+def _rotate_left(node):
+  top = node.right
+  node.right, top.left = top.left, node
+  _update(node)
+  _update(top)
+  return top
+
+def _merge(left, right):
+  if left is None:
+    return right
+  if right is None:
+    return left
+  if left.priority > right.priority:
+    left.right = _merge(left.right, right)
+    _update(left)
+    return left
+  right.left = _merge(left, right.left)
+  _update(right)
+  return right
+
+class IntervalTree:
+  '''
+  Half-open intervals [start, end) with a key each, e.g. the times of the
+  shows of one venue keyed by show id. A treap ordered by (start, end,
+  key) where every node knows the largest end below it: add and remove
+  are O(log n) expected, overlapping() O(log n + k) for k overlaps, so a
+  check costs the same with ten shows or a million.
+  Starts, ends and keys only need to be comparable.
+  '''
+  def __init__(self, seed=None):
+    self._root = None
+    self._size = 0
+    self._random = random.Random(seed)
+
+  def __len__(self):
+    return self._size
+
+  def add(self, start, end, key=0):
+    self._root = self._insert(self._root, _Node(start, end, key, self._random.random()))
+    self._size += 1
+
+  def _insert(self, node, new):
+    if node is None:
+      return new
+    if (new.start, new.end, new.key) < (node.start, node.end, node.key):
+      node.left = self._insert(node.left, new)
+      if node.left.priority > node.priority:
+        return _rotate_right(node)
+    else:
+      node.right = self._insert(node.right, new)
+      if node.right.priority > node.priority:
+        return _rotate_left(node)
+    _update(node)
+    return node
+
+  def remove(self, start, end, key=0):
+    '''
+    Removes one interval equal to (start, end, key), returns whether there
+    was one.
+    '''
+    size = self._size
+    self._root = self._delete(self._root, (start, end, key))
+    return self._size < size
+
+  def _delete(self, node, target):
+    if node is None:
+      return None
+    current = (node.start, node.end, node.key)
+    if target == current:
+      self._size -= 1
+      return _merge(node.left, node.right)
+    if target < current:
+      node.left = self._delete(node.left, target)
+    else:
+      node.right = self._delete(node.right, target)
+    _update(node)
+    return node
+
+  def overlapping(self, start, end):
+    '''
+    Yields the (start, end, key) of the intervals overlapping [start, end).
+    Subtrees that end before start or begin after end are never visited.
+    '''
+    stack = [self._root]
+    while stack:
+      node = stack.pop()
+      if node is None or node.max_end <= start:
+        continue
+      stack.append(node.left)
+      if node.start < end:
+        if node.end > start:
+          yield node.start, node.end, node.key
+        stack.append(node.right)
+
+#----------------------------------------------------------------------------#
+# Booking index.
+#----------------------------------------------------------------------------#
+
+def _conflict(kind, show_id, start_time, end_time):
+  return {"with": kind, "show_id": show_id, "start_time": start_time, "end_time": end_time}
+
+class BookingIndex:
+  '''
+  The times of the shows of each venue and each artist in IntervalTrees,
+  for databases without range types (SQLite) and for bulk imports, which
+  check rows before inserting them. The tree of a venue or an artist is
+  loaded from the database the first time it is checked; when the trees
+  hold more than max_intervals intervals the least recently used ones are
+  dropped, to be loaded again if needed.
+
+  Shows added with add() are pending until flushed() is called, once they
+  are committed: the trees holding pending shows are never dropped, as
+  the database could not give them back.
+  '''
+  def __init__(self, max_intervals=1000000):
+    self.max_intervals = max_intervals
+    self._trees = OrderedDict()
+    self._intervals = 0
+    # (kind, owner id): number of pending shows in its tree
+    self._pending = {}
+    self._lock = threading.RLock()
+
+  def _tree(self, kind, owner_id):
+    with self._lock:
+      tree = self._trees.get((kind, owner_id))
+      if tree is not None:
+        self._trees.move_to_end((kind, owner_id))
+        return tree
+    column = Show.venue_id if kind == 'Venue' else Show.artist_id
+    tree = IntervalTree()
+    for show_id, start_time, end_time in db.session.query(
+        Show.id, Show.start_time, Show.end_time).filter(column == owner_id):
+      tree.add(start_time, end_time, show_id)
+    with self._lock:
+      if (kind, owner_id) not in self._trees:
+        self._trees[(kind, owner_id)] = tree
+        self._intervals += len(tree)
+        self._trim(keep=(kind, owner_id))
+      return self._trees[(kind, owner_id)]
+
+  def conflicts(self, venue_id, artist_id, start_time, end_time):
+    '''
+    The shows of the venue or of the artist overlapping [start_time,
+    end_time), as {"with": "Venue" or "Artist", "show_id", "start_time",
+    "end_time"}, a show of both counting for the venue.
+    '''
+    conflicts = {}
+    for kind, owner_id in (('Venue', venue_id), ('Artist', artist_id)):
+      for start, end, key in self._tree(kind, owner_id).overlapping(start_time, end_time):
+        conflicts.setdefault(key, _conflict(kind, key, start, end))
+    return sorted(conflicts.values(), key=lambda conflict: (conflict['start_time'], conflict['show_id']))
+
+  def add(self, venue_id, artist_id, start_time, end_time, key):
+    # a show about to be inserted, pending until flushed()
+    with self._lock:
+      for entity in (('Venue', venue_id), ('Artist', artist_id)):
+        self._tree(*entity).add(start_time, end_time, key)
+        self._intervals += 1
+        self._pending[entity] = self._pending.get(entity, 0) + 1
+
+  def remove(self, venue_id, artist_id, start_time, end_time, key):
+    # a pending show the database refused
+    with self._lock:
+      for entity in (('Venue', venue_id), ('Artist', artist_id)):
+        tree = self._trees.get(entity)
+        if tree is not None and tree.remove(start_time, end_time, key):
+          self._intervals -= 1
+          if self._pending.get(entity, 0) > 1:
+            self._pending[entity] -= 1
+          else:
+            self._pending.pop(entity, None)
+
+  def flushed(self):
+    # the pending shows are committed, their trees can be reloaded
+    with self._lock:
+      self._pending.clear()
+      self._trim()
+
+  def _trim(self, keep=None):
+    # drops least recently used trees beyond max_intervals, except keep
+    # and the trees holding pending shows
+    excess = self._intervals - self.max_intervals
+    if excess <= 0:
+      return
+    dropped = []
+    for entity, tree in self._trees.items():
+      if excess <= 0:
+        break
+      if entity != keep and entity not in self._pending:
+        dropped.append(entity)
+        excess -= len(tree)
+    for entity in dropped:
+      self._intervals -= len(self._trees.pop(entity))
+
+  def invalidate(self, changed=None):
+    # the trees of venues and artists whose shows changed are reloaded
+    with self._lock:
+      if changed is None:
+        self._trees.clear()
+        self._intervals = 0
+        return
+      for entity in changed:
+        tree = self._trees.pop(entity, None)
+        if tree is not None:
+          self._intervals -= len(tree)
+
+booking_index = BookingIndex(max_intervals=100000)
+on_change(booking_index.invalidate)
+
+#----------------------------------------------------------------------------#
+# Booking.
+#----------------------------------------------------------------------------#
+
+# On Postgres the span of a show is tsrange(start_time, end_time): the
+# exclusion constraints on (venue_id, span) and (artist_id, span) reject
+# double bookings, even between concurrent transactions, and their GiST
+# indexes answer the overlap queries (see the bookings migration). Without
+# btree_gist the migration only creates a GiST index on the span. Other
+# databases answer find_conflicts from booking_index, which only knows the
+# shows of other processes once it reloads a tree: book_show takes the
+# write lock of the database first and checks against the table itself.
+
+def _span(start, end):
+  return func.tsrange(start, end)
+
+def find_conflicts(venue_id, artist_id, start_time, end_time=None):
+  '''
+  The shows that a show of the artist at the venue from start_time to
+  end_time (SHOW_LENGTH later by default) would overlap, see
+  BookingIndex.conflicts. Empty when the slot is free.
+  '''
+  end_time = end_time or start_time + SHOW_LENGTH
+  if db.engine.dialect.name != 'postgresql':
+    return booking_index.conflicts(venue_id, artist_id, start_time, end_time)
+  overlaps = _span(Show.start_time, Show.end_time).op('&&')(_span(start_time, end_time))
+  rows = db.session.query(Show.id, Show.venue_id, Show.start_time, Show.end_time) \
+    .filter(or_(and_(Show.venue_id == venue_id, overlaps),
+                and_(Show.artist_id == artist_id, overlaps))) \
+    .order_by(Show.start_time, Show.id)
+  return [_conflict('Venue' if row.venue_id == venue_id else 'Artist', row.id, row.start_time, row.end_time)
+          for row in rows]
+
+def _table_conflicts(venue_id, artist_id, start_time, end_time):
+  # the overlapping shows read from the table, walking the
+  # (venue_id, start_time) and (artist_id, start_time) indexes
+  rows = db.session.query(Show.id, Show.venue_id, Show.start_time, Show.end_time) \
+    .filter(or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+            Show.start_time < end_time, Show.end_time > start_time) \
+    .order_by(Show.start_time, Show.id)
+  return [_conflict('Venue' if row.venue_id == venue_id else 'Artist', row.id, row.start_time, row.end_time)
+          for row in rows]
+
+def _lock_shows():
+  # a write that changes nothing starts the write transaction, as BEGIN
+  # IMMEDIATE would: another book_show waits here until this one commits
+  db.session.execute(Show.__table__.update().where(false()).values(id=Show.id))
+
+class BookingConflict(Exception):
+  def __init__(self, conflicts):
+    self.conflicts = conflicts
+    first = conflicts[0] if conflicts else None
+    super().__init__('the {} already has a show from {} to {}'.format(
+      first['with'].lower(), first['start_time'], first['end_time']) if first
+      else 'the venue or the artist was booked at the same time')
+
+EXCLUSION_VIOLATION = '23P01'
+
+def book_show(venue_id, artist_id, start_time, end_time=None):
+  '''
+  Adds a show to the session and flushes it, or raises BookingConflict
+  when the venue or the artist is already booked at that time. The
+  caller commits. Without the exclusion constraints of Postgres the
+  write lock of the database is held from the check to that commit.
+  '''
+  end_time = end_time or start_time + SHOW_LENGTH
+  if db.engine.dialect.name == 'postgresql':
+    conflicts = find_conflicts(venue_id, artist_id, start_time, end_time)
+  else:
+    _lock_shows()
+    conflicts = _table_conflicts(venue_id, artist_id, start_time, end_time)
+  if conflicts:
+    raise BookingConflict(conflicts)
+  show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, end_time=end_time)
+  db.session.add(show)
+  try:
+    db.session.flush()
+  except IntegrityError as error:
+    if getattr(error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+      raise
+    # booked by another transaction since the check
+    db.session.rollback()
+    raise BookingConflict(find_conflicts(venue_id, artist_id, start_time, end_time))
+  return show
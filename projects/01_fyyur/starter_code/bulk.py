@@ -0,0 +1,532 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, text
+from sqlalchemy.exc import DBAPIError
+from wtforms import SelectMultipleField, DateTimeField
+
+from forms import VenueForm, ArtistForm, ShowForm, form_schema, validate_data
+from models import db, notify_changes, parse_genres, Genre, Venue, Artist, Show, venue_genres, artist_genres, SHOW_LENGTH
+from bookings import BookingIndex
+
+BATCH_SIZE = 1000
+# show times an import of shows keeps in memory (see check_booking), two
+# per show at about 250 bytes each
+BOOKING_INTERVALS = 2000000
+PROGRESS_EVERY = 100000
+SAMPLE_REJECTS = 10
+
+#----------------------------------------------------------------------------#
+# Kinds of records.
+#----------------------------------------------------------------------------#
+
+def _text(value):
+  return str(value) if value not in (None, '') else None
+
+def _boolean(value):
+  if isinstance(value, bool) or value is None:
+    return bool(value)
+  if str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y'):
+    return True
+  if str(value).strip().lower() in ('', '0', 'false', 'f', 'no', 'n'):
+    return False
+  raise ValueError('Not a valid boolean')
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _datetime(value):
+  if value in (None, ''):
+    return None
+  try:
+    return datetime.strptime(str(value), DATETIME_FORMAT)
+  except ValueError:
+    raise ValueError('Not a valid datetime value')
+
+def _integer(value):
+  if value in (None, ''):
+    return None
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    raise ValueError('Not a valid integer')
+
+class Kind:
+  '''
+  A kind of record that can be imported and exported: its model, the form
+  whose rules its rows follow (see forms.validate_data), the columns
+  that are not on the form, with their parsers, and for venues and
+  artists the (table, column) linking them to their genres. An "id"
+  column is optional, rows without one get the next id of the table.
+  The foreign keys of the model (the venue and the artist of a show) are
+  checked by the import itself, SQLite does not enforce them.
+  '''
+  def __init__(self, model, form_class, extra_columns=(), genre_link=None):
+    self.model = model
+    self.form_class = form_class
+    self.genre_link = genre_link
+    fields = form_schema(form_class).fields
+    self.fields = [name for name, _ in fields]
+    self.multiple = frozenset(name for name, field in fields if isinstance(field, SelectMultipleField))
+    self.datetime_formats = {name: field.format for name, field in fields if isinstance(field, DateTimeField)}
+    self.extra_columns = dict(extra_columns, id=_integer)
+    self.datetime_formats.update((name, DATETIME_FORMAT) for name, parse in self.extra_columns.items()
+                                 if parse is _datetime)
+    self.integer_columns = frozenset(column.name for column in model.__table__.columns
+                                     if column.type.python_type is int)
+    self.required_columns = frozenset(column.name for column in model.__table__.columns
+                                      if not column.nullable and not column.primary_key
+                                      and column.default is None)
+    self.columns = ['id'] + self.fields + [name for name in self.extra_columns if name != 'id']
+    # the columns of the table, genres are in the link table
+    self.table_columns = [name for name in self.columns if name not in self.multiple]
+    # (column name, referenced column) of each foreign key
+    self.references = [(column.name, key.column) for column in model.__table__.columns
+                       for key in column.foreign_keys]
+
+  def mapping(self, row):
+    '''
+    Returns (mapping, errors): the column values to insert for row, or the
+    error messages of each invalid column.
+    '''
+    formdata = {}
+    for name in self.fields:
+      if name in row:
+        value = row[name]
+        if value is None:
+          # null in NDJSON, a missing cell in CSV
+          value = ''
+        elif name in self.multiple and not isinstance(value, list):
+          # "Jazz,Soul" in a CSV cell, as genres are stored
+          value = parse_genres(value)
+        formdata[name] = value
+    data, errors = validate_data(self.form_class, formdata)
+    mapping = {}
+    for name, value in data.items():
+      if name in self.integer_columns and name not in errors:
+        try:
+          value = _integer(value)
+        except ValueError as error:
+          errors[name] = [str(error)]
+      if value is None and name in self.required_columns and name not in errors:
+        errors[name] = ['This field is required.']
+      mapping[name] = value
+    for name, parse in self.extra_columns.items():
+      try:
+        value = parse(row.get(name))
+      except ValueError as error:
+        errors[name] = [str(error)]
+        continue
+      if value is not None or name != 'id':
+        mapping[name] = value
+    return mapping, errors
+
+  def unknown_references(self, mappings):
+    '''
+    Returns {index in mappings: errors} of the rows whose foreign keys
+    match no row, with one query per foreign key for all of mappings.
+    '''
+    errors = {}
+    for name, referenced in self.references:
+      values = {mapping[name] for mapping in mappings if mapping.get(name) is not None}
+      if not values:
+        continue
+      known = {value for value, in db.session.query(referenced).filter(referenced.in_(values))}
+      for index, mapping in enumerate(mappings):
+        if mapping.get(name) is not None and mapping[name] not in known:
+          errors.setdefault(index, {})[name] = ['No {} with id {}.'.format(
+            referenced.table.name.lower(), mapping[name])]
+    return errors
+
+  def changes(self, mappings):
+    # the (table, id) pairs the change listeners are told about; imported
+    # rows are new, no page shows them yet, only the lists of their table
+    # (and for shows their venue and artist) change
+    changed = {(self.model.__tablename__, None)}
+    if self.model is Show:
+      for mapping in mappings:
+        changed.add(('Venue', mapping['venue_id']))
+        changed.add(('Artist', mapping['artist_id']))
+    return changed
+
+  def genres_of(self, ids):
+    # {id: [genre names]} of the rows ids, in one query
+    link, column = self.genre_link
+    genres = {}
+    for owner_id, name in db.session.query(link.c[column], Genre.name) \
+        .join(Genre, Genre.id == link.c.genre_id) \
+        .filter(link.c[column].in_(ids)).order_by(Genre.name):
+      genres.setdefault(owner_id, []).append(name)
+    return genres
+
+  def exported(self, row, genres, fmt):
+    # a query row as the record written by export, which import reads back
+    record = dict(zip(self.table_columns, row))
+    for name in self.multiple:
+      record[name] = list(genres) if fmt == 'ndjson' else ','.join(genres)
+    for name, format in self.datetime_formats.items():
+      if record[name] is not None:
+        record[name] = record[name].strftime(format)
+    return record
+
+KINDS = {
+  'venues': Kind(Venue, VenueForm, {
+    'website': _text, 'seeking_talent': _boolean, 'seeking_description': _text},
+    genre_link=(venue_genres, 'venue_id')),
+  'artists': Kind(Artist, ArtistForm, {
+    'website': _text, 'seeking_venue': _boolean, 'seeking_description': _text},
+    genre_link=(artist_genres, 'artist_id')),
+  'shows': Kind(Show, ShowForm, {'end_time': _datetime}),
+}
+
+#----------------------------------------------------------------------------#
+# Readers and writers.
+#----------------------------------------------------------------------------#
+
+# Files are read and written one record at a time, so memory use does not
+# depend on their size. Readers yield (line number, row, errors), errors
+# being set when the line itself could not be parsed.
+
+def guess_format(path):
+  return 'ndjson' if path.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+def open_file(path, mode):
+  if path == '-':
+    return sys.stdin if 'r' in mode else sys.stdout
+  return open(path, mode, newline='', encoding='utf-8')
+
+def read_csv(stream):
+  reader = csv.DictReader(stream)
+  for row in reader:
+    yield reader.line_num, row, None
+
+def read_ndjson(stream):
+  for number, line in enumerate(stream, 1):
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError as error:
+      yield number, None, {'line': ['Not valid JSON: {}'.format(error)]}
+      continue
+    if not isinstance(row, dict):
+      yield number, None, {'line': ['Not a JSON object']}
+      continue
+    yield number, row, None
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+def checked(kind, records):
+  '''
+  Yields (line number, row, mapping, errors) for each record, mapping
+  being None when the row is rejected.
+  '''
+  for number, row, errors in records:
+    if errors is None:
+      mapping, errors = kind.mapping(row)
+      if not errors:
+        yield number, row, mapping, None
+        continue
+    yield number, row, None, errors
+
+def export_records(kind, fmt, batch_size=BATCH_SIZE):
+  '''
+  Yields the records of kind as export writes them. Rows come from a
+  server-side cursor on Postgres, batch_size at a time, and the genres of
+  each batch from one query.
+  '''
+  columns = [getattr(kind.model, name) for name in kind.table_columns]
+  rows = iter(db.session.query(*columns).order_by(kind.model.id).yield_per(batch_size))
+  while True:
+    batch = list(islice(rows, batch_size))
+    if not batch:
+      return
+    genres = kind.genres_of([row.id for row in batch]) if kind.genre_link else {}
+    for row in batch:
+      yield kind.exported(row, genres.get(row.id, ()), fmt)
+
+#----------------------------------------------------------------------------#
+# Import.
+#----------------------------------------------------------------------------#
+
+class ImportReport:
+  def __init__(self, clock=time.monotonic):
+    self.clock = clock
+    self.started = clock()
+    self.read = 0
+    self.imported = 0
+    self.rejected = 0
+    self.samples = []
+
+  def reject(self, number, row, errors):
+    self.rejected += 1
+    if len(self.samples) < SAMPLE_REJECTS:
+      self.samples.append((number, errors))
+
+  @property
+  def elapsed(self):
+    return self.clock() - self.started
+
+  @property
+  def rate(self):
+    return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+  def summary(self):
+    return '{} rows read, {} imported, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+      self.read, self.imported, self.rejected, self.elapsed, self.rate)
+
+def insert_rows(kind, mappings, genre_ids):
+  if kind.genre_link is None:
+    db.session.bulk_insert_mappings(kind.model, mappings)
+    return
+  link, column = kind.genre_link
+  db.session.bulk_insert_mappings(kind.model, [
+    {name: value for name, value in mapping.items() if name not in kind.multiple} for mapping in mappings])
+  links = [{column: mapping['id'], 'genre_id': genre_ids[name]}
+           for mapping in mappings for name in mapping['genres']]
+  if links:
+    db.session.execute(link.insert(), links)
+
+def insert_batch(kind, batch, genre_ids):
+  '''
+  Inserts the (line number, row, mapping) of batch in one transaction and
+  returns the ones the database refused. When the batch fails as a whole
+  (a duplicate id, a venue deleted since its shows were checked), its
+  rows are retried one by one in savepoints so only the bad ones are
+  rejected.
+  '''
+  try:
+    insert_rows(kind, [mapping for _, _, mapping in batch], genre_ids)
+    db.session.commit()
+    return []
+  except DBAPIError:
+    db.session.rollback()
+
+  refused = []
+  for item in batch:
+    try:
+      with db.session.begin_nested():
+        insert_rows(kind, [item[2]], genre_ids)
+    except DBAPIError as error:
+      refused.append((item, str(getattr(error, 'orig', error)).strip()))
+  db.session.commit()
+  return refused
+
+def assign_ids(model, mappings):
+  # the link rows of genres need the ids of new rows before they are
+  # inserted: they are taken from the id sequence on Postgres, after the
+  # largest id elsewhere (a single writer)
+  mappings = [mapping for mapping in mappings if 'id' not in mapping]
+  if not mappings:
+    return
+  table = model.__table__.name
+  if db.engine.dialect.name == 'postgresql':
+    ids = [row[0] for row in db.session.execute(text(
+      "SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+      {'table': '"{}"'.format(table), 'count': len(mappings)})]
+  else:
+    start = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+    ids = range(start, start + len(mappings))
+  for mapping, new_id in zip(mappings, ids):
+    mapping['id'] = new_id
+
+def resolve_genres(genre_ids, names):
+  # adds the ids of the genres called names to genre_ids, creating the
+  # missing genres in their own transaction, so a refused batch does not
+  # take them back
+  missing = [name for name in names if name not in genre_ids]
+  if missing:
+    genres = Genre.named(missing)
+    db.session.commit()
+    genre_ids.update((genre.name, genre.id) for genre in genres)
+
+def reset_sequence(model):
+  # rows imported with their id do not advance the id sequence
+  if db.engine.dialect.name == 'postgresql':
+    table = model.__table__.name
+    db.session.execute(text(
+      "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+      "coalesce(max(id), 0) + 1, false) FROM \"{}\"".format(table)),
+      {'table': '"{}"'.format(table)})
+    db.session.commit()
+
+def _booking_key(number, mapping):
+  # shows of the file are told apart from those of the database by their
+  # negative line number, until they have an id
+  return mapping.get('id', -number)
+
+def _booked(conflict):
+  show = 'show {}'.format(conflict['show_id']) if conflict['show_id'] > 0 \
+    else 'the show of line {}'.format(-conflict['show_id'])
+  return 'The {} already has {} from {} to {}'.format(
+    conflict['with'].lower(), show, conflict['start_time'], conflict['end_time'])
+
+def check_booking(bookings, number, mapping):
+  '''
+  Returns the errors of a show that does not end after it starts, or
+  overlaps a show of its venue or its artist, in the database or earlier
+  in the file. Otherwise adds the show to bookings and returns None.
+  '''
+  start_time = mapping['start_time']
+  if mapping.get('end_time') is None:
+    mapping['end_time'] = start_time + SHOW_LENGTH
+  if mapping['end_time'] <= start_time:
+    return {'end_time': ['Must be after start_time.']}
+  conflicts = bookings.conflicts(mapping['venue_id'], mapping['artist_id'], start_time, mapping['end_time'])
+  if conflicts:
+    return {'row': [_booked(conflict) for conflict in conflicts]}
+  bookings.add(mapping['venue_id'], mapping['artist_id'], start_time, mapping['end_time'],
+               _booking_key(number, mapping))
+  return None
+
+def import_records(kind, records, batch_size=BATCH_SIZE, rejects=None, progress=None):
+  '''
+  Validates and inserts records (from a reader) batch_size rows per
+  transaction. Rejected rows are written to rejects, a writer of NDJSON
+  lines, if given. After each transaction the change listeners are told
+  which tables and entities were written, as the session events are not
+  fired by bulk inserts. Shows that would double book a venue or an
+  artist are rejected. Returns an ImportReport.
+  '''
+  report = ImportReport()
+  batch = []
+  with_ids = False
+  genre_ids = {}
+  bookings = BookingIndex(BOOKING_INTERVALS) if kind.model is Show else None
+
+  def reject(number, row, errors):
+    report.reject(number, row, errors)
+    if rejects is not None:
+      rejects.write(json.dumps({'line': number, 'errors': errors, 'row': row}, default=str) + '\n')
+
+  def refuse(number, row, mapping, errors):
+    reject(number, row, errors)
+    if bookings is not None:
+      bookings.remove(mapping['venue_id'], mapping['artist_id'], mapping['start_time'],
+                      mapping['end_time'], _booking_key(number, mapping))
+
+  def flush():
+    unknown = kind.unknown_references([mapping for _, _, mapping in batch])
+    for index, errors in unknown.items():
+      refuse(*batch[index], errors)
+    items = [item for index, item in enumerate(batch) if index not in unknown]
+    mappings = [mapping for _, _, mapping in items]
+    if kind.genre_link is not None:
+      resolve_genres(genre_ids, {name for mapping in mappings for name in mapping['genres']})
+      assign_ids(kind.model, mappings)
+    refused = insert_batch(kind, items, genre_ids) if items else []
+    for item, message in refused:
+      refuse(*item, {'row': [message]})
+    if bookings is not None:
+      bookings.flushed()
+    refused_items = {id(item) for item, _ in refused}
+    inserted = [item[2] for item in items if id(item) not in refused_items]
+    report.imported += len(inserted)
+    if inserted:
+      notify_changes(kind.changes(inserted))
+    batch.clear()
+
+  for number, row, mapping, errors in checked(kind, records):
+    report.read += 1
+    if mapping is not None and bookings is not None:
+      errors = check_booking(bookings, number, mapping)
+      if errors:
+        mapping = None
+    if mapping is None:
+      reject(number, row, errors)
+    else:
+      with_ids = with_ids or 'id' in mapping
+      batch.append((number, row, mapping))
+      if len(batch) >= batch_size:
+        flush()
+    if progress is not None and report.read % PROGRESS_EVERY == 0:
+      progress(report)
+  if batch:
+    flush()
+  if with_ids:
+    reset_sequence(kind.model)
+  return report
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Bulk import and export of venues, artists and shows.')
+
+KIND = click.Choice(sorted(KINDS))
+FORMAT = click.Choice(sorted(READERS))
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=KIND)
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'fmt', type=FORMAT, help='Default: from the file extension.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows per transaction.')
+@click.option('--rejects', type=click.Path(allow_dash=True), help='Write rejected rows to this NDJSON file.')
+def import_command(kind, path, fmt, batch_size, rejects):
+  '''
+  Imports venues, artists or shows from a CSV (with a header line) or an
+  NDJSON file, "-" being stdin. Rows are checked with the rules of the
+  create forms; invalid rows are rejected and the others imported.
+  '''
+  fmt = fmt or guess_format(path)
+  kind = KINDS[kind]
+
+  def progress(report):
+    click.echo('{} rows ({:.0f} rows/s)'.format(report.read, report.rate), err=True)
+
+  stream = open_file(path, 'r')
+  rejects_stream = open_file(rejects, 'w') if rejects else None
+  try:
+    report = import_records(kind, READERS[fmt](stream), batch_size, rejects_stream, progress)
+  finally:
+    for f in (stream, rejects_stream):
+      if f not in (None, sys.stdin, sys.stdout):
+        f.close()
+
+  click.echo(report.summary(), err=True)
+  for number, errors in report.samples:
+    click.echo('  line {}: {}'.format(number, '; '.join(
+      '{}: {}'.format(name, ', '.join(messages)) for name, messages in errors.items())), err=True)
+  if report.rejected > len(report.samples):
+    click.echo('  ...', err=True)
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=KIND)
+@click.argument('path', type=click.Path(allow_dash=True))
+@click.option('--format', 'fmt', type=FORMAT, help='Default: from the file extension.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows fetched at a time.')
+def export_command(kind, path, fmt, batch_size):
+  '''
+  Exports venues, artists or shows to a CSV or an NDJSON file, "-" being
+  stdout, in the format import reads.
+  '''
+  fmt = fmt or guess_format(path)
+  kind = KINDS[kind]
+  started = time.monotonic()
+  count = 0
+  stream = open_file(path, 'w')
+  try:
+    if fmt == 'csv':
+      writer = csv.DictWriter(stream, kind.columns)
+      writer.writeheader()
+      write = writer.writerow
+    else:
+      write = lambda record: stream.write(json.dumps(record) + '\n')
+    for record in export_records(kind, fmt, batch_size):
+      write(record)
+      count += 1
+  finally:
+    if stream is not sys.stdout:
+      stream.close()
+  elapsed = time.monotonic() - started
+  click.echo('{} rows exported in {:.1f}s ({:.0f} rows/s)'.format(
+    count, elapsed, count / elapsed if elapsed > 0 else 0.0), err=True)
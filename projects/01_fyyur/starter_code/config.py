@@ -9,5 +9,23 @@ DEBUG = True
 # Connect to the database
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Serve the /venues listing from an in-process cache, see listings.py
+CACHE_VENUE_AREAS = True
+
+# Rendered page cache, see fragments.py. FRAGMENT_CACHE_BACKEND shares it
+# between processes: None, 'filesystem' (FRAGMENT_CACHE_DIR) or
+# 'memcached' (FRAGMENT_CACHE_SERVERS, e.g. ['127.0.0.1:11211']).
+CACHE_PAGES = True
+FRAGMENT_CACHE_SIZE = 1024
+FRAGMENT_CACHE_TTL = 300
+FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND')
+FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')
+FRAGMENT_CACHE_SERVERS = [server for server in os.environ.get('FRAGMENT_CACHE_SERVERS', '').split(',') if server]
+
+# psycopg2 sends the executemany() of bulk inserts (flask fyyur import, see
+# bulk.py) as multi-row INSERT statements instead of one INSERT per row
+if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+  SQLALCHEMY_ENGINE_OPTIONS = {'executemany_mode': 'values'}
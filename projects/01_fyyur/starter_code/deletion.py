@@ -0,0 +1,62 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import select
+
+from models import db, notify_changes, Venue, Show, venue_genres
+
+DELETE_CHUNK_SIZE = 20000
+
+#----------------------------------------------------------------------------#
+# Venues.
+#----------------------------------------------------------------------------#
+
+def _delete_shows(venue_id, limit):
+  # one statement for up to limit shows of the venue, none of them loaded
+  chunk = select([Show.id]).where(Show.venue_id == venue_id).order_by(Show.id).limit(limit)
+  return Show.query.filter(Show.id.in_(chunk)).delete(synchronize_session=False)
+
+def delete_venue(venue_id, chunk_size=DELETE_CHUNK_SIZE):
+  '''
+  Deletes the venue with its shows and its genres, a statement per table
+  rather than a row at a time through the session. Returns {"id",
+  "name", "deleted_shows"}, or None when there is no such venue.
+
+  A venue with more than chunk_size shows has them deleted chunk_size at
+  a time, a transaction each, so the rows and the index pages of a long
+  history are not all locked at once. The last chunk, the genre links
+  and the venue go in one final transaction: the venue is never gone
+  while shows still point at it, and a failed deletion can be retried.
+  The change listeners hear about the venue, its shows and the artists
+  that played there, whose pages list those shows.
+  '''
+  venue = db.session.query(Venue.id, Venue.name).filter(Venue.id == venue_id).first()
+  if venue is None:
+    return None
+  artist_ids = [artist_id for artist_id, in
+                db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  changed = {('Venue', venue_id), ('Show', None)} | {('Artist', artist_id) for artist_id in artist_ids}
+  deleted = 0
+  committed = False
+  try:
+    while True:
+      count = _delete_shows(venue_id, chunk_size)
+      deleted += count
+      if count < chunk_size:
+        break
+      db.session.commit()
+      committed = True
+    db.session.execute(venue_genres.delete().where(venue_genres.c.venue_id == venue_id))
+    Venue.query.filter(Venue.id == venue_id).delete(synchronize_session=False)
+    db.session.commit()
+    committed = True
+  except Exception:
+    db.session.rollback()
+    raise
+  finally:
+    # bulk deletes do not fire the session events; chunks committed
+    # before a failure are gone too
+    if committed:
+      notify_changes(changed)
+  return {"id": venue.id, "name": venue.name, "deleted_shows": deleted}
@@ -0,0 +1,125 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Venue and artist pages.
+#----------------------------------------------------------------------------#
+
+# Each page is loaded with one query: the venue (or artist) joined to its
+# shows and, for each show, the name and image of the other side, plus
+# one query for its genres (joined, they would multiply the show rows).
+# Shows come ordered by start_time and are split into past and upcoming
+# in one pass.
+
+def split_shows(shows, serialize, now):
+  past_shows, upcoming_shows = [], []
+  for show in shows:
+    (upcoming_shows if show.start_time > now else past_shows).append(serialize(show))
+  return past_shows, upcoming_shows
+
+def show_with_artist(show):
+  return {
+    "artist_id": show.artist.id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": show.start_time
+  }
+
+def show_with_venue(show):
+  return {
+    "venue_id": show.venue.id,
+    "venue_name": show.venue.name,
+    "venue_image_link": show.venue.image_link,
+    "start_time": show.start_time
+  }
+
+def venue_detail(venue_id, now=None):
+  '''
+  Data of the venue page, or None if there is no such venue.
+  '''
+  venue = Venue.query.options(
+    joinedload(Venue.shows).joinedload(Show.artist).load_only(Artist.id, Artist.name, Artist.image_link),
+    selectinload(Venue.genre_rows)
+  ).filter(Venue.id == venue_id).one_or_none()
+  if venue is None:
+    return None
+
+  past_shows, upcoming_shows = split_shows(venue.shows, show_with_artist, now or datetime.now())
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
+def artist_detail(artist_id, now=None):
+  '''
+  Data of the artist page, or None if there is no such artist.
+  '''
+  artist = Artist.query.options(
+    joinedload(Artist.shows).joinedload(Show.venue).load_only(Venue.id, Venue.name, Venue.image_link),
+    selectinload(Artist.genre_rows)
+  ).filter(Artist.id == artist_id).one_or_none()
+  if artist is None:
+    return None
+
+  past_shows, upcoming_shows = split_shows(artist.shows, show_with_venue, now or datetime.now())
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+  }
+
+#----------------------------------------------------------------------------#
+# Entities of the pages.
+#----------------------------------------------------------------------------#
+
+# Besides their venue or artist, the pages show the other side of its
+# shows (names, images). Pages with more than RELATED_ENTITIES of them are
+# checked against the whole list instead, so a cache hit costs a handful
+# of version reads however many shows the page has.
+RELATED_ENTITIES = 50
+
+def related_entities(kind, column, owner_column, owner_id):
+  ids = [other_id for other_id, in db.session.query(column).filter(owner_column == owner_id)
+         .distinct().limit(RELATED_ENTITIES + 1)]
+  if len(ids) > RELATED_ENTITIES:
+    return [('list', kind)]
+  return [(kind, other_id) for other_id in ids]
+
+def venue_entities(venue_id):
+  return related_entities('Artist', Show.artist_id, Show.venue_id, venue_id)
+
+def artist_entities(artist_id):
+  return related_entities('Venue', Show.venue_id, Show.artist_id, artist_id)
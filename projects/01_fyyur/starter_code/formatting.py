@@ -0,0 +1,65 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Datetime formatting.
+#----------------------------------------------------------------------------#
+
+# Named formats of the datetime filter, any other value is a babel pattern.
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+  '''
+  The parsed babel pattern of format and the parsed locale, built once per
+  (format, locale).
+  '''
+  return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+def _normalize(value):
+  if isinstance(value, str):
+    # values that are still strings (mock data, JSON) are parsed here
+    value = dateutil.parser.parse(value)
+  # aware values keep their own offset, as with babel.dates.format_datetime
+  return value
+
+@lru_cache(maxsize=4096)
+def _format(value, format, locale):
+  pattern, parsed_locale = compiled_pattern(format, locale)
+  return pattern.apply(_normalize(value), parsed_locale)
+
+def format_datetime(value, format='medium', locale=None):
+  '''
+  The datetime Jinja filter: formats a datetime (or an ISO 8601 string)
+  with a named format or a babel pattern. Results of repeated timestamps
+  come from a bounded LRU.
+  '''
+  return _format(value, format, str(locale or babel.dates.LC_TIME))
+
+def format_datetimes(values, format='medium', locale=None):
+  '''
+  Formats a column of timestamps in one call, e.g. every start_time of a
+  page. The pattern and locale are resolved once, equal timestamps are
+  formatted once, and the column does not go through the LRU, so it does
+  not evict the timestamps the filter keeps hitting.
+  '''
+  locale = str(locale or babel.dates.LC_TIME)
+  pattern, parsed_locale = compiled_pattern(format, locale)
+  formatted = {}
+  result = []
+  for value in values:
+    text = formatted.get(value)
+    if text is None:
+      text = formatted[value] = pattern.apply(_normalize(value), parsed_locale)
+    result.append(text)
+  return result
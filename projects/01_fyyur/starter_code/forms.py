@@ -1,9 +1,142 @@
 from datetime import datetime
-from flask_wtf import Form
+import threading
+from flask_wtf import FlaskForm
+from werkzeug.datastructures import MultiDict
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.meta import DefaultMeta
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError
 
-class ShowForm(Form):
+#----------------------------------------------------------------------------#
+# Choices.
+#----------------------------------------------------------------------------#
+
+# Built once and shared by every form class and every form instance, so
+# they are tuples: nothing can change them for everybody else.
+STATE_CHOICES = (
+    ('AL', 'AL'),
+    ('AK', 'AK'),
+    ('AZ', 'AZ'),
+    ('AR', 'AR'),
+    ('CA', 'CA'),
+    ('CO', 'CO'),
+    ('CT', 'CT'),
+    ('DE', 'DE'),
+    ('DC', 'DC'),
+    ('FL', 'FL'),
+    ('GA', 'GA'),
+    ('HI', 'HI'),
+    ('ID', 'ID'),
+    ('IL', 'IL'),
+    ('IN', 'IN'),
+    ('IA', 'IA'),
+    ('KS', 'KS'),
+    ('KY', 'KY'),
+    ('LA', 'LA'),
+    ('ME', 'ME'),
+    ('MT', 'MT'),
+    ('NE', 'NE'),
+    ('NV', 'NV'),
+    ('NH', 'NH'),
+    ('NJ', 'NJ'),
+    ('NM', 'NM'),
+    ('NY', 'NY'),
+    ('NC', 'NC'),
+    ('ND', 'ND'),
+    ('OH', 'OH'),
+    ('OK', 'OK'),
+    ('OR', 'OR'),
+    ('MD', 'MD'),
+    ('MA', 'MA'),
+    ('MI', 'MI'),
+    ('MN', 'MN'),
+    ('MS', 'MS'),
+    ('MO', 'MO'),
+    ('PA', 'PA'),
+    ('RI', 'RI'),
+    ('SC', 'SC'),
+    ('SD', 'SD'),
+    ('TN', 'TN'),
+    ('TX', 'TX'),
+    ('UT', 'UT'),
+    ('VT', 'VT'),
+    ('VA', 'VA'),
+    ('WA', 'WA'),
+    ('WV', 'WV'),
+    ('WI', 'WI'),
+    ('WY', 'WY'),
+)
+
+GENRE_CHOICES = (
+    ('Alternative', 'Alternative'),
+    ('Blues', 'Blues'),
+    ('Classical', 'Classical'),
+    ('Country', 'Country'),
+    ('Electronic', 'Electronic'),
+    ('Folk', 'Folk'),
+    ('Funk', 'Funk'),
+    ('Hip-Hop', 'Hip-Hop'),
+    ('Heavy Metal', 'Heavy Metal'),
+    ('Instrumental', 'Instrumental'),
+    ('Jazz', 'Jazz'),
+    ('Musical Theatre', 'Musical Theatre'),
+    ('Pop', 'Pop'),
+    ('Punk', 'Punk'),
+    ('R&B', 'R&B'),
+    ('Reggae', 'Reggae'),
+    ('Rock n Roll', 'Rock n Roll'),
+    ('Soul', 'Soul'),
+    ('Other', 'Other'),
+)
+
+STATES = frozenset(value for value, _ in STATE_CHOICES)
+GENRES = frozenset(value for value, _ in GENRE_CHOICES)
+
+#----------------------------------------------------------------------------#
+# Fields and validators.
+#----------------------------------------------------------------------------#
+
+class OneOf(AnyOf):
+    '''
+    AnyOf over a frozenset: checking a value costs the same whatever the
+    number of choices. The values of a multiple select are checked one by
+    one.
+    '''
+    def __init__(self, values, message=None):
+        super().__init__(frozenset(values), message)
+
+    def __call__(self, form, field):
+        data = field.data if isinstance(field.data, (list, tuple)) else (field.data,)
+        for value in data:
+            if value not in self.values:
+                message = self.message
+                if message is None:
+                    message = field.gettext("'%(value)s' is not a valid choice for this field.")
+                raise ValidationError(message % {'value': value})
+
+class SharedChoices:
+    '''
+    Select fields over shared choices: the tuple is kept as it is instead of
+    copied into a list for every form, and the OneOf validator checks the
+    value instead of a scan of the choices.
+    '''
+    def __init__(self, label=None, validators=None, choices=(), **kwargs):
+        super().__init__(label, validators, choices=None, **kwargs)
+        self.choices = choices
+
+    def pre_validate(self, form):
+        pass
+
+class ChoiceField(SharedChoices, SelectField):
+    pass
+
+class MultipleChoiceField(SharedChoices, SelectMultipleField):
+    pass
+
+#----------------------------------------------------------------------------#
+# Forms.
+#----------------------------------------------------------------------------#
+
+class ShowForm(FlaskForm):
     artist_id = StringField(
         'artist_id'
     )
@@ -13,71 +146,20 @@ class ShowForm(Form):
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        # called for every form, datetime.today() would be the import time
+        default=datetime.today
     )
 
-class VenueForm(Form):
+class VenueForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
-        'state', validators=[DataRequired()],
-        choices=[
-            ('AL', 'AL'),
-            ('AK', 'AK'),
-            ('AZ', 'AZ'),
-            ('AR', 'AR'),
-            ('CA', 'CA'),
-            ('CO', 'CO'),
-            ('CT', 'CT'),
-            ('DE', 'DE'),
-            ('DC', 'DC'),
-            ('FL', 'FL'),
-            ('GA', 'GA'),
-            ('HI', 'HI'),
-            ('ID', 'ID'),
-            ('IL', 'IL'),
-            ('IN', 'IN'),
-            ('IA', 'IA'),
-            ('KS', 'KS'),
-            ('KY', 'KY'),
-            ('LA', 'LA'),
-            ('ME', 'ME'),
-            ('MT', 'MT'),
-            ('NE', 'NE'),
-            ('NV', 'NV'),
-            ('NH', 'NH'),
-            ('NJ', 'NJ'),
-            ('NM', 'NM'),
-            ('NY', 'NY'),
-            ('NC', 'NC'),
-            ('ND', 'ND'),
-            ('OH', 'OH'),
-            ('OK', 'OK'),
-            ('OR', 'OR'),
-            ('MD', 'MD'),
-            ('MA', 'MA'),
-            ('MI', 'MI'),
-            ('MN', 'MN'),
-            ('MS', 'MS'),
-            ('MO', 'MO'),
-            ('PA', 'PA'),
-            ('RI', 'RI'),
-            ('SC', 'SC'),
-            ('SD', 'SD'),
-            ('TN', 'TN'),
-            ('TX', 'TX'),
-            ('UT', 'UT'),
-            ('VT', 'VT'),
-            ('VA', 'VA'),
-            ('WA', 'WA'),
-            ('WV', 'WV'),
-            ('WI', 'WI'),
-            ('WY', 'WY'),
-        ]
+    state = ChoiceField(
+        'state', validators=[DataRequired(), OneOf(STATES)],
+        choices=STATE_CHOICES
     )
     address = StringField(
         'address', validators=[DataRequired()]
@@ -88,97 +170,24 @@ class VenueForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
-        # TODO implement enum restriction
-        'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+    genres = MultipleChoiceField(
+        'genres', validators=[DataRequired(), OneOf(GENRES)],
+        choices=GENRE_CHOICES
     )
     facebook_link = StringField(
         'facebook_link', validators=[URL()]
     )
 
-class ArtistForm(Form):
+class ArtistForm(FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
     city = StringField(
         'city', validators=[DataRequired()]
     )
-    state = SelectField(
-        'state', validators=[DataRequired()],
-        choices=[
-            ('AL', 'AL'),
-            ('AK', 'AK'),
-            ('AZ', 'AZ'),
-            ('AR', 'AR'),
-            ('CA', 'CA'),
-            ('CO', 'CO'),
-            ('CT', 'CT'),
-            ('DE', 'DE'),
-            ('DC', 'DC'),
-            ('FL', 'FL'),
-            ('GA', 'GA'),
-            ('HI', 'HI'),
-            ('ID', 'ID'),
-            ('IL', 'IL'),
-            ('IN', 'IN'),
-            ('IA', 'IA'),
-            ('KS', 'KS'),
-            ('KY', 'KY'),
-            ('LA', 'LA'),
-            ('ME', 'ME'),
-            ('MT', 'MT'),
-            ('NE', 'NE'),
-            ('NV', 'NV'),
-            ('NH', 'NH'),
-            ('NJ', 'NJ'),
-            ('NM', 'NM'),
-            ('NY', 'NY'),
-            ('NC', 'NC'),
-            ('ND', 'ND'),
-            ('OH', 'OH'),
-            ('OK', 'OK'),
-            ('OR', 'OR'),
-            ('MD', 'MD'),
-            ('MA', 'MA'),
-            ('MI', 'MI'),
-            ('MN', 'MN'),
-            ('MS', 'MS'),
-            ('MO', 'MO'),
-            ('PA', 'PA'),
-            ('RI', 'RI'),
-            ('SC', 'SC'),
-            ('SD', 'SD'),
-            ('TN', 'TN'),
-            ('TX', 'TX'),
-            ('UT', 'UT'),
-            ('VT', 'VT'),
-            ('VA', 'VA'),
-            ('WA', 'WA'),
-            ('WV', 'WV'),
-            ('WI', 'WI'),
-            ('WY', 'WY'),
-        ]
+    state = ChoiceField(
+        'state', validators=[DataRequired(), OneOf(STATES)],
+        choices=STATE_CHOICES
     )
     phone = StringField(
         # TODO implement validation logic for state
@@ -187,34 +196,71 @@ class ArtistForm(Form):
     image_link = StringField(
         'image_link'
     )
-    genres = SelectMultipleField(
-        # TODO implement enum restriction
-        'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+    genres = MultipleChoiceField(
+        'genres', validators=[DataRequired(), OneOf(GENRES)],
+        choices=GENRE_CHOICES
     )
     facebook_link = StringField(
         # TODO implement enum restriction
         'facebook_link', validators=[URL()]
     )
 
-# TODO IMPLEMENT NEW ARTIST FORM AND NEW SHOW FORM
+#----------------------------------------------------------------------------#
+# Validation without a request.
+#----------------------------------------------------------------------------#
+
+class FormSchema:
+    '''
+    The fields of a form class, bound once without a form or a request, to
+    check plain dicts (bulk imports, JSON bodies) with the rules of the
+    form: the same processing and validators, and no CSRF. Fields missing
+    from the dict are empty rather than defaulted (a show without a
+    start_time is not booked now), so required ones fail.
+    Fields keep the values of the last call, so a schema is used by one
+    thread at a time, see validate_data().
+    '''
+    def __init__(self, form_class):
+        meta = DefaultMeta()
+        unbound = [(name, getattr(form_class, name)) for name in dir(form_class)
+                   if not name.startswith('_') and hasattr(getattr(form_class, name), '_formfield')]
+        unbound.sort(key=lambda item: item[1].creation_counter)
+        self.fields = [(name, field.bind(None, name, _meta=meta)) for name, field in unbound]
+
+    def validate(self, data):
+        '''
+        Returns (values, errors): the value of every field as the form would
+        have it after processing data (a dict, lists for the values of a
+        multiple select, or a MultiDict), and the error messages of the
+        fields that failed.
+        '''
+        formdata = data if hasattr(data, 'getlist') else MultiDict(data)
+        values, errors = {}, {}
+        for name, field in self.fields:
+            if name in formdata:
+                field.process(formdata)
+            else:
+                field.process(formdata, data=None)
+            if not field.validate(None):
+                errors[name] = list(field.errors)
+            values[name] = field.data
+        return values, errors
+
+_local = threading.local()
+
+def form_schema(form_class):
+    # one schema per form class and per thread
+    schemas = getattr(_local, 'schemas', None)
+    if schemas is None:
+        schemas = _local.schemas = {}
+    schema = schemas.get(form_class)
+    if schema is None:
+        schema = schemas[form_class] = FormSchema(form_class)
+    return schema
+
+def validate_data(form_class, data):
+    '''
+    Checks data with the rules of form_class without building a form,
+    outside of any request, e.g. validate_data(VenueForm, {"name": ...}).
+    Returns (values, errors) as FormSchema.validate.
+    '''
+    return form_schema(form_class).validate(data)
@@ -0,0 +1,283 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+#----------------------------------------------------------------------------#
+# Shared backends.
+#----------------------------------------------------------------------------#
+
+# A backend stores values for every process of the site. It has the
+# get/set/delete API of a memcached client: get(key) returns None when the
+# key is missing or expired, set(key, value, expire=seconds) with 0 for no
+# expiry. Keys are short hashes, values are picklable.
+
+class MemoryClient:
+  '''
+  In-process stand-in for a memcached client, for development and for a
+  single process. Entries beyond maxsize are evicted least recently used.
+  '''
+  def __init__(self, maxsize=10000, clock=time.time):
+    self.maxsize = maxsize
+    self.clock = clock
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      value, expires_at = entry
+      if expires_at and self.clock() >= expires_at:
+        del self._entries[key]
+        return None
+      self._entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, expire=0):
+    with self._lock:
+      self._entries[key] = (value, self.clock() + expire if expire else 0)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+    return True
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+    return True
+
+class MemcacheBackend:
+  '''
+  Any memcached client (pymemcache, python-memcached, MemoryClient), with
+  values pickled so the client needs no serializer.
+  '''
+  def __init__(self, client):
+    self.client = client
+
+  def get(self, key):
+    data = self.client.get(key)
+    return pickle.loads(data) if data is not None else None
+
+  def set(self, key, value, expire=0):
+    self.client.set(key, pickle.dumps(value), expire=int(expire))
+
+  def delete(self, key):
+    self.client.delete(key)
+
+class FileSystemBackend:
+  '''
+  One file per key in directory, shared by the processes of one host.
+  Writes go through a temporary file and a rename, so readers never see a
+  partial entry.
+  '''
+  def __init__(self, directory, clock=time.time):
+    self.directory = directory
+    self.clock = clock
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, key):
+    return os.path.join(self.directory, key)
+
+  def get(self, key):
+    try:
+      with open(self._path(key), 'rb') as f:
+        expires_at, value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+      return None
+    if expires_at and self.clock() >= expires_at:
+      self.delete(key)
+      return None
+    return value
+
+  def set(self, key, value, expire=0):
+    fd, temporary = tempfile.mkstemp(dir=self.directory)
+    with os.fdopen(fd, 'wb') as f:
+      pickle.dump((self.clock() + expire if expire else 0, value), f)
+    os.replace(temporary, self._path(key))
+
+  def delete(self, key):
+    try:
+      os.remove(self._path(key))
+    except OSError:
+      pass
+
+def make_backend(config):
+  '''
+  The shared backend chosen by FRAGMENT_CACHE_BACKEND: None (this process
+  only), 'filesystem' (FRAGMENT_CACHE_DIR) or 'memcached'
+  (FRAGMENT_CACHE_SERVERS, a list of "host:port", needs pymemcache; without
+  servers the in-process MemoryClient stands in).
+  '''
+  name = config.get('FRAGMENT_CACHE_BACKEND')
+  if not name:
+    return None
+  if name == 'filesystem':
+    directory = config.get('FRAGMENT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'fyyur-fragments')
+    return FileSystemBackend(directory)
+  if name == 'memcached':
+    servers = config.get('FRAGMENT_CACHE_SERVERS')
+    if not servers:
+      return MemcacheBackend(MemoryClient())
+    from pymemcache.client.hash import HashClient
+    return MemcacheBackend(HashClient([tuple(server.rsplit(':', 1)) for server in servers]))
+  raise ValueError('unknown fragment cache backend {}'.format(name))
+
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+class FragmentCache:
+  '''
+  Rendered pages and template fragments, keyed by name and entity id and
+  checked against the versions of the entities they show.
+
+  An entity is a (kind, id) pair such as ('Venue', 3). Writing an entity
+  bumps its version to a new random token (bump()), which invalidates
+  every fragment rendered with the old one, wherever it is stored. Entries
+  keep the versions of their entities and are only served while all of
+  them are current.
+
+  The versions are read before rendering (versions()) and stored with the
+  entry (set()): a write that commits while the value renders bumps a
+  version after it was read, so the entry is stale from the start.
+
+  Entries live in an in-process LRU of maxsize and, with a shared
+  backend, in the backend too. Versions live in the backend so a write in
+  one process invalidates the fragments of all the others; without a
+  backend everything stays in this process.
+  '''
+  def __init__(self, maxsize=1024, backend=None, ttl=300, clock=time.time):
+    self.maxsize = maxsize
+    self.backend = backend
+    self.ttl = ttl
+    self.clock = clock
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._versions = {}
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _key(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+  def version(self, entity):
+    if self.backend is None:
+      with self._lock:
+        return self._versions.setdefault(entity, uuid.uuid4().hex)
+    key = self._key('version', entity)
+    version = self.backend.get(key)
+    if version is None:
+      # a version that was evicted is replaced by a new one, never reused,
+      # so entries stored under the old one cannot come back
+      version = uuid.uuid4().hex
+      self.backend.set(key, version)
+    return version
+
+  def versions(self, entities):
+    # the ((kind, id), version) of entities, each entity once
+    return tuple((entity, self.version(entity)) for entity in dict.fromkeys(entities))
+
+  def bump(self, *entities):
+    for entity in entities:
+      if self.backend is None:
+        # the next version() makes a new token; entities that were never
+        # rendered (e.g. the rows of a bulk import) are not remembered
+        with self._lock:
+          self._versions.pop(entity, None)
+      else:
+        self.backend.set(self._key('version', entity), uuid.uuid4().hex)
+
+  def _load(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+    if entry is None and self.backend is not None:
+      entry = self.backend.get(key)
+      if entry is not None:
+        self._store_local(key, entry)
+    return entry
+
+  def _store_local(self, key, entry):
+    with self._lock:
+      self._entries[key] = entry
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+
+  def get(self, name, *ids):
+    '''
+    The cached value of (name, *ids), or None when it is missing, expired
+    or one of its entities was written since it was rendered.
+    '''
+    key = self._key(name, ids)
+    entry = self._load(key)
+    if entry is not None:
+      value, versions, expires_at = entry
+      if self.clock() < expires_at and all(
+          self.version(entity) == version for entity, version in versions):
+        self.hits += 1
+        return value
+    self.misses += 1
+    return None
+
+  def set(self, name, ids, value, versions, ttl=None):
+    '''
+    Caches value for ttl seconds (the default ttl at most), valid while
+    versions, read by versions() before value was rendered, are current.
+    '''
+    ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+    if ttl <= 0:
+      return
+    entry = (value, versions, self.clock() + ttl)
+    key = self._key(name, ids)
+    self._store_local(key, entry)
+    if self.backend is not None:
+      self.backend.set(key, entry, expire=ttl)
+
+  def get_or_render(self, name, ids, entities, render, ttl=None):
+    '''
+    Returns the cached value of (name, *ids), or calls render(), which
+    returns a value showing entities, and caches it for ttl seconds (the
+    default ttl at most).
+    '''
+    value = self.get(name, *ids)
+    if value is None:
+      versions = self.versions(entities)
+      value = render()
+      self.set(name, ids, value, versions, ttl)
+    return value
+
+  def fragment(self, name, *ids, entities=(), ttl=None, caller=None):
+    '''
+    Template helper, caches the body of a call block:
+      {% call cache_fragment('venue-header', venue.id, entities=[('Venue', venue.id)]) %}
+        ...
+      {% endcall %}
+    '''
+    value = self.get(name, *ids)
+    if value is None:
+      versions = self.versions(entities)
+      value = str(caller())
+      self.set(name, ids, value, versions, ttl)
+    return Markup(value)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._versions.clear()
+      self.hits = 0
+      self.misses = 0
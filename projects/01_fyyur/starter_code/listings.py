@@ -0,0 +1,194 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, func, tuple_
+
+from models import db, on_change, Genre, Venue, Artist, Show, venue_genres, artist_genres
+
+SHOWS_PER_PAGE = 60
+GENRE_PAGE_SIZE = 60
+
+#----------------------------------------------------------------------------#
+# Venue areas.
+#----------------------------------------------------------------------------#
+
+def venue_areas(now=None):
+  '''
+  Venues grouped by (city, state) with the number of upcoming shows of each
+  venue, in the shape the venues page expects, from one GROUP BY query.
+  Only shows after now are joined, so the count is the filtered COUNT and
+  venues without upcoming shows still appear with 0.
+  Returns (areas, next_start): next_start is the earliest upcoming show,
+  the moment a count goes down without any write, or None.
+  '''
+  now = now or datetime.now()
+  rows = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state,
+    func.count(Show.id), func.min(Show.start_time)
+  ).outerjoin(Show, and_(Show.venue_id == Venue.id, Show.start_time > now)) \
+   .group_by(Venue.id) \
+   .order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+
+  areas = []
+  next_start = None
+  for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+    area = {"city": city, "state": state, "venues": []}
+    for venue_id, name, _, _, num_upcoming_shows, first_start in venues:
+      area["venues"].append({
+        "id": venue_id,
+        "name": name,
+        "num_upcoming_shows": num_upcoming_shows,
+      })
+      if first_start is not None and (next_start is None or first_start < next_start):
+        next_start = first_start
+    areas.append(area)
+  return areas, next_start
+
+class VenueAreaCache:
+  '''
+  Keeps the result of venue_areas() so the venues page costs no query.
+  It is dropped by any committed write to a venue or a show, and expires
+  by itself when the earliest upcoming show starts (its count changes) or
+  after max_age seconds, which bounds how long writes made by other
+  processes go unseen.
+  '''
+  def __init__(self, max_age=60, clock=time.monotonic, now=datetime.now):
+    self.max_age = max_age
+    self.clock = clock
+    self.now = now
+    self._areas = None
+    self._expires = None
+    self._next_start = None
+    self._generation = 0
+    self._lock = threading.Lock()
+
+  def get(self):
+    with self._lock:
+      areas = self._areas
+      if areas is not None and self.clock() < self._expires and (
+          self._next_start is None or self.now() < self._next_start):
+        return areas
+      generation = self._generation
+    areas, next_start = venue_areas(self.now())
+    with self._lock:
+      if generation != self._generation:
+        # a write was committed while querying, do not keep the result
+        return areas
+      self._areas = areas
+      self._next_start = next_start
+      self._expires = self.clock() + self.max_age
+    return areas
+
+  def invalidate(self, changed=None):
+    if changed is not None and not any(table in ('Venue', 'Show') for table, _ in changed):
+      return
+    with self._lock:
+      self._areas = None
+      self._generation += 1
+
+venue_area_cache = VenueAreaCache()
+on_change(venue_area_cache.invalidate)
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+# The venues (or artists) of a genre are a range of the (genre_id, venue_id)
+# index, read in id order a page at a time: each page costs the same
+# whatever the size of the genre, with no sort and no scan of the genres.
+
+def _genre_page(model, link, column, genre_id, after, limit):
+  rows = db.session.query(model.id, model.name, model.city, model.state) \
+    .join(link, link.c[column] == model.id) \
+    .filter(link.c.genre_id == genre_id, link.c[column] > (after or 0)) \
+    .order_by(link.c[column]).limit(limit + 1).all()
+  data = [{"id": row.id, "name": row.name, "city": row.city, "state": row.state} for row in rows[:limit]]
+  return data, data[-1]["id"] if len(rows) > limit else None
+
+def genre_listing(name, venues_after=None, artists_after=None, limit=GENRE_PAGE_SIZE):
+  '''
+  The venues and artists of the genre called name, limit of each after the
+  given ids, with the ids to continue from ("next_venues_after",
+  "next_artists_after", None at the end), or None if there is no such
+  genre.
+  '''
+  genre_id = db.session.query(Genre.id).filter(Genre.name == name).scalar()
+  if genre_id is None:
+    return None
+  venues, next_venues_after = _genre_page(Venue, venue_genres, 'venue_id', genre_id, venues_after, limit)
+  artists, next_artists_after = _genre_page(Artist, artist_genres, 'artist_id', genre_id, artists_after, limit)
+  return {
+    "name": name,
+    "venues": venues,
+    "artists": artists,
+    "venues_after": venues_after,
+    "artists_after": artists_after,
+    "next_venues_after": next_venues_after,
+    "next_artists_after": next_artists_after,
+  }
+
+#----------------------------------------------------------------------------#
+# Shows.
+#----------------------------------------------------------------------------#
+
+def encode_show_cursor(start_time, show_id):
+  return '{}_{}'.format(start_time.isoformat(), show_id)
+
+def decode_show_cursor(cursor):
+  '''
+  Returns (start_time, id) or raises ValueError.
+  '''
+  start_time, show_id = cursor.rsplit('_', 1)
+  return datetime.fromisoformat(start_time), int(show_id)
+
+class ShowWindow:
+  '''
+  The shows starting in [start, end), ordered by (start_time, id), at most
+  limit of them after the (start_time, id) cursor after, for templates.
+  Iterating streams the rows from a server side cursor, walking the
+  Show.start_time index, so neither the query nor the page holds the whole
+  calendar. Once iterated, next_cursor is the cursor of the following page,
+  or None on the last one.
+  '''
+  def __init__(self, start, end, after=None, limit=SHOWS_PER_PAGE):
+    self.start = start
+    self.end = end
+    self.after = after
+    self.limit = limit
+    self.next_cursor = None
+
+  def query(self):
+    query = db.session.query(
+      Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+      Show.artist_id, Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id) \
+     .join(Artist, Artist.id == Show.artist_id) \
+     .filter(Show.start_time >= self.start, Show.start_time < self.end)
+    if self.after is not None:
+      query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*self.after))
+    # one extra row tells whether there is a next page
+    return query.order_by(Show.start_time, Show.id).limit(self.limit + 1) \
+                .execution_options(stream_results=True).yield_per(100)
+
+  def __iter__(self):
+    self.next_cursor = None
+    last = None
+    for number, row in enumerate(self.query()):
+      if number == self.limit:
+        self.next_cursor = encode_show_cursor(last.start_time, last.id)
+        break
+      last = row
+      yield {
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+        "start_time": row.start_time
+      }
@@ -0,0 +1,45 @@
+"""name and location search indexes
+
+Revision ID: 3b9c1f2d7e4a
+Revises: fa3d46e9e4ac
+Create Date: 2026-10-18 17:40:12.104532
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9c1f2d7e4a'
+down_revision = 'fa3d46e9e4ac'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', sa.text('lower(city)')], unique=False)
+    op.create_index('ix_Artist_state_city', 'Artist', ['state', sa.text('lower(city)')], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    available = bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar()
+    if not available:
+        # searches still work, with a sequential scan
+        logger.warning('pg_trgm is not installed, skipping the trigram name indexes')
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX "ix_Venue_name_trgm" ON "Venue" USING gin (lower(name) gin_trgm_ops)')
+    op.execute('CREATE INDEX "ix_Artist_name_trgm" ON "Artist" USING gin (lower(name) gin_trgm_ops)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS "ix_Artist_name_trgm"')
+    op.execute('DROP INDEX IF EXISTS "ix_Venue_name_trgm"')
+    op.drop_index('ix_Artist_state_city', table_name='Artist')
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
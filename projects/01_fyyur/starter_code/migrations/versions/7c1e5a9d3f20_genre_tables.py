@@ -0,0 +1,98 @@
+"""genre tables
+
+Revision ID: 7c1e5a9d3f20
+Revises: b5a84b729541
+Create Date: 2026-10-18 17:55:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a9d3f20'
+down_revision = 'b5a84b729541'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+# (table, link table, link column) of the rows that have genres
+OWNERS = (
+    ('Venue', 'VenueGenre', 'venue_id'),
+    ('Artist', 'ArtistGenre', 'artist_id'),
+)
+
+
+def split(value):
+    # the old comma separated column, without duplicates
+    return list(dict.fromkeys(genre.strip() for genre in (value or '').split(',') if genre.strip()))
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, link, column in OWNERS:
+        op.create_table(link,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([column], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id_{}'.format(link, column), link, ['genre_id', column], unique=False)
+
+    # split the genres strings into rows, a batch of owners at a time
+    bind = op.get_bind()
+    genre_ids = {}
+    for table, link, column in OWNERS:
+        owner = sa.table(table, sa.column('id'), sa.column('genres'))
+        links = sa.table(link, sa.column(column), sa.column('genre_id'))
+        last_id = 0
+        while True:
+            rows = bind.execute(sa.select([owner.c.id, owner.c.genres])
+                                .where(owner.c.id > last_id)
+                                .order_by(owner.c.id).limit(BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            values = []
+            for row in rows:
+                for name in split(row.genres):
+                    if name not in genre_ids:
+                        genre_ids[name] = bind.execute(genre.insert().values(name=name)).inserted_primary_key[0]
+                    values.append({column: row.id, 'genre_id': genre_ids[name]})
+            if values:
+                bind.execute(links.insert(), values)
+
+    op.drop_column('Venue', 'genres')
+    op.drop_column('Artist', 'genres')
+
+
+def downgrade():
+    op.add_column('Artist', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+    op.add_column('Venue', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+
+    bind = op.get_bind()
+    genre = sa.table('Genre', sa.column('id'), sa.column('name'))
+    names = dict(bind.execute(sa.select([genre.c.id, genre.c.name])).fetchall())
+    for table, link, column in OWNERS:
+        owner = sa.table(table, sa.column('id'), sa.column('genres'))
+        links = sa.table(link, sa.column(column), sa.column('genre_id'))
+        genres = {}
+        for owner_id, genre_id in bind.execute(sa.select([links.c[column], links.c.genre_id])):
+            genres.setdefault(owner_id, []).append(names[genre_id])
+        update = owner.update().where(owner.c.id == sa.bindparam('owner_id')).values(genres=sa.bindparam('value'))
+        values = [{'owner_id': owner_id, 'value': ','.join(sorted(owner_genres))}
+                  for owner_id, owner_genres in genres.items()]
+        for start in range(0, len(values), BATCH_SIZE):
+            bind.execute(update, values[start:start + BATCH_SIZE])
+
+    for table, link, column in reversed(OWNERS):
+        op.drop_index('ix_{}_genre_id_{}'.format(link, column), table_name=link)
+        op.drop_table(link)
+    op.drop_table('Genre')
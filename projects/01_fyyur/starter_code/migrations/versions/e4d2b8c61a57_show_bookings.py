@@ -0,0 +1,81 @@
+"""show end times and booking constraints
+
+Revision ID: e4d2b8c61a57
+Revises: 7c1e5a9d3f20
+Create Date: 2026-10-18 19:04:37.552910
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d2b8c61a57'
+down_revision = '7c1e5a9d3f20'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+BATCH_SIZE = 50000
+
+# models.SHOW_LENGTH
+SHOW_LENGTH = {'postgresql': "interval '2 hours'"}
+
+EXCLUSIONS = (
+    ('ex_Show_venue_id_span', 'venue_id'),
+    ('ex_Show_artist_id_span', 'artist_id'),
+)
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+
+    # existing shows are booked for SHOW_LENGTH, a range of ids at a time
+    bind = op.get_bind()
+    show = sa.table('Show', sa.column('id'), sa.column('start_time'), sa.column('end_time'))
+    if bind.dialect.name == 'postgresql':
+        end_time = show.c.start_time + sa.text(SHOW_LENGTH['postgresql'])
+    else:
+        end_time = sa.func.datetime(show.c.start_time, '+2 hours')
+    last_id = bind.execute(sa.select([sa.func.max(show.c.id)])).scalar() or 0
+    for start in range(0, last_id, BATCH_SIZE):
+        bind.execute(show.update()
+                     .where(sa.and_(show.c.id > start, show.c.id <= start + BATCH_SIZE))
+                     .values(end_time=end_time))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if bind.dialect.name != 'postgresql':
+        return
+    available = bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")).scalar()
+    if available:
+        savepoint = bind.begin_nested()
+        try:
+            op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+            for name, column in EXCLUSIONS:
+                op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" EXCLUDE USING gist '
+                           '({} WITH =, tsrange(start_time, end_time) WITH &&)'.format(name, column))
+            savepoint.commit()
+            return
+        except sa.exc.DBAPIError as error:
+            # double bookings made before this migration
+            savepoint.rollback()
+            logger.warning('existing shows overlap, skipping the booking constraints: %s',
+                           str(error.orig).strip())
+    else:
+        logger.warning('btree_gist is not installed, skipping the booking constraints')
+    # bookings.find_conflicts still gets an index for its overlap queries
+    op.execute('CREATE INDEX "ix_Show_span" ON "Show" USING gist (tsrange(start_time, end_time))')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS "ix_Show_span"')
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, column in EXCLUSIONS:
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "{}"'.format(name))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
@@ -0,0 +1,194 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import timedelta
+
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, func
+
+db = SQLAlchemy()
+
+def parse_genres(value):
+    # genres written as one comma separated string (CSV cells, old rows)
+    return [genre.strip() for genre in (value or '').split(',') if genre.strip()]
+
+#----------------------------------------------------------------------------#
+# Genres.
+#----------------------------------------------------------------------------#
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def named(cls, names):
+        '''
+        The genres called names, in that order, adding the ones that do not
+        exist yet to the session.
+        '''
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+        genres = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in genres:
+                genres[name] = cls(name=name)
+                db.session.add(genres[name])
+        return [genres[name] for name in names]
+
+# The primary keys answer "genres of a venue", the (genre_id, ...) indexes
+# "venues of a genre" (/genres/<name>).
+venue_genres = db.Table('VenueGenre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table('ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+class HasGenres:
+    '''
+    genres: the names of the genres of a venue or an artist, read from
+    genre_rows once per loaded row and kept on the instance until the
+    genres change or the row is expired. Assigning a list of names (or a
+    comma separated string) replaces the genres.
+    '''
+    @property
+    def genres(self):
+        names = self.__dict__.get('_genre_names')
+        if names is None:
+            names = self.__dict__['_genre_names'] = tuple(genre.name for genre in self.genre_rows)
+        return names
+
+    @genres.setter
+    def genres(self, names):
+        if isinstance(names, str):
+            names = parse_genres(names)
+        self.genre_rows = Genre.named(names)
+        self.__dict__.pop('_genre_names', None)
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+class Venue(HasGenres, db.Model):
+    __tablename__ = 'Venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+
+    shows = db.relationship('Show', backref='venue', lazy=True, order_by='Show.start_time')
+    genre_rows = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
+
+class Artist(HasGenres, db.Model):
+    __tablename__ = 'Artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+
+    shows = db.relationship('Show', backref='artist', lazy=True, order_by='Show.start_time')
+    genre_rows = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
+
+# How long a show books its venue and its artist when no end is given.
+SHOW_LENGTH = timedelta(hours=2)
+
+def _default_end_time(context):
+    return context.get_current_parameters()['start_time'] + SHOW_LENGTH
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        # the shows of a venue or an artist, in time order (detail pages,
+        # upcoming counts), and the calendar of /shows
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    # double bookings are refused by bookings.book_show and, on Postgres,
+    # by the exclusion constraints of the bookings migration
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+
+def _forget_genre_names(target, *args):
+    target.__dict__.pop('_genre_names', None)
+
+for model in (Venue, Artist):
+    event.listen(model.genre_rows, 'append', _forget_genre_names)
+    event.listen(model.genre_rows, 'remove', _forget_genre_names)
+    event.listen(model, 'expire', _forget_genre_names)
+    event.listen(model, 'refresh', _forget_genre_names)
+
+# "City, ST" searches, see search.py. The trigram indexes used by name
+# searches only exist in Postgres and are created by the migration.
+db.Index('ix_Venue_state_city', Venue.state, func.lower(Venue.city))
+db.Index('ix_Artist_state_city', Artist.state, func.lower(Artist.city))
+
+#----------------------------------------------------------------------------#
+# Change notifications.
+#----------------------------------------------------------------------------#
+
+# Callbacks run after every commit that wrote models, with the set of
+# (table name, id) pairs that were inserted, updated or deleted, a show
+# also counting as a change of its venue and its artist. Caches register
+# here instead of every view remembering what to invalidate.
+change_listeners = []
+
+def on_change(callback):
+    change_listeners.append(callback)
+    return callback
+
+@event.listens_for(SignallingSession, 'after_flush')
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault('changed', set())
+    for instance in session.new | session.dirty | session.deleted:
+        table = getattr(instance, '__tablename__', None)
+        if table is not None:
+            changed.add((table, instance.id))
+        if isinstance(instance, Show):
+            changed.add(('Venue', instance.venue_id))
+            changed.add(('Artist', instance.artist_id))
+
+def notify_changes(changed):
+    # also called directly by writes that bypass the session events, such
+    # as bulk inserts (see bulk.py); an id of None means "some rows of
+    # the table"
+    for callback in change_listeners:
+        callback(changed)
+
+@event.listens_for(SignallingSession, 'after_commit')
+def _notify_changes(session):
+    changed = session.info.pop('changed', None)
+    if changed:
+        notify_changes(changed)
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('changed', None)
@@ -0,0 +1,83 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+
+from models import db, Venue, Artist, Show
+
+RESULTS_PER_PAGE = 20
+
+#----------------------------------------------------------------------------#
+# Venue and artist search.
+#----------------------------------------------------------------------------#
+
+# Partial, case-insensitive name search: lower(name) LIKE '%term%', which
+# Postgres answers with the trigram indexes on lower("Venue".name) and
+# lower("Artist".name) (see the name search migration).
+# A term of the form "City, ST" also matches everything in that city, through
+# the (state, lower(city)) indexes.
+# Each page is one query: the matching rows of the page, their number of
+# upcoming shows (only upcoming shows are joined) and the total number of
+# matches as a window count over the grouped rows.
+
+LOCATION = re.compile(r'^\s*(?P<city>[^,]+?)\s*,\s*(?P<state>[A-Za-z]{2})\s*$')
+
+def parse_location(term):
+  match = LOCATION.match(term)
+  if match is None:
+    return None
+  return match.group('city').lower(), match.group('state').upper()
+
+def escape_like(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search(model, show_column, term, page=1, per_page=RESULTS_PER_PAGE, now=None):
+  '''
+  Returns {"count", "data": [{"id", "name", "num_upcoming_shows"}], "page",
+  "next_page"} for the page of entities of model matching term.
+  '''
+  term = (term or '').strip()
+  now = now or datetime.now()
+  matches = func.lower(model.name).like('%' + escape_like(term.lower()) + '%', escape='\\')
+  location = parse_location(term)
+  if location is not None:
+    city, state = location
+    matches = or_(matches, and_(model.state == state, func.lower(model.city) == city))
+
+  rows = db.session.query(
+    model.id, model.name,
+    func.count(Show.id).label('num_upcoming_shows'),
+    func.count().over().label('total')
+  ).outerjoin(Show, and_(show_column == model.id, Show.start_time > now)) \
+   .filter(matches) \
+   .group_by(model.id) \
+   .order_by(model.name, model.id) \
+   .offset((page - 1) * per_page).limit(per_page).all()
+
+  if rows:
+    count = rows[0].total
+  elif page > 1:
+    # past the last page the window has no row to report the total on
+    count = db.session.query(func.count(model.id)).filter(matches).scalar()
+  else:
+    count = 0
+  return {
+    "count": count,
+    "data": [{
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows,
+    } for row in rows],
+    "page": page,
+    "next_page": page + 1 if page * per_page < count else None,
+  }
+
+def search_venues(term, page=1, per_page=RESULTS_PER_PAGE, now=None):
+  return search(Venue, Show.venue_id, term, page, per_page, now)
+
+def search_artists(term, page=1, per_page=RESULTS_PER_PAGE, now=None):
+  return search(Artist, Show.artist_id, term, page, per_page, now)
@@ -2,3 +2,27 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// buttons with data-delete-url send a DELETE request and follow the
+// redirect of the JSON response, see delete_venue in app.py
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('[data-delete-url]');
+  if (!button || !window.confirm(button.dataset.confirm || 'Delete?')) {
+    return;
+  }
+  button.disabled = true;
+  fetch(button.dataset.deleteUrl, { method: 'DELETE' })
+    .then(function (response) { return response.json(); })
+    .then(function (result) {
+      if (result.success) {
+        window.location = result.redirect;
+      } else {
+        button.disabled = false;
+        window.alert(result.message);
+      }
+    })
+    .catch(function () {
+      button.disabled = false;
+      window.alert('An error occurred, nothing was deleted.');
+    });
+});
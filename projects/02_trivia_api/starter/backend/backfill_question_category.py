@@ -0,0 +1,64 @@
+import sys
+
+from sqlalchemy import create_engine, text
+
+from models import database_path
+
+'''
+backfill_question_category.py
+    prepares databases restored from older dumps, where questions.category
+    is a text column holding ids ('1') or category names ('Science'), for
+    migrations/002_question_category_fk.sql
+    a no-op on databases where the column is already an integer, like one
+    restored from the trivia.psql shipped here
+    names are replaced by the id of the matching category, values that match
+    no category are set to NULL and reported
+    rows are updated in id ranges of batch_size, each range in its own
+    transaction, for both passes, so large tables are not locked for the
+    whole run
+    USAGE
+        python backfill_question_category.py [database_url]
+        python migrate.py [database_url]
+'''
+NOT_A_CATEGORY_ID = (
+    "CASE WHEN category ~ '^\\s*[0-9]+\\s*$' "
+    "THEN trim(category)::bigint NOT IN (SELECT id FROM categories) ELSE true END"
+)
+
+
+def backfill(engine, batch_size=10000):
+    with engine.connect() as connection:
+        data_type = connection.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = 'questions' AND column_name = 'category'")).scalar()
+        if data_type == 'integer':
+            return 0, []
+        low, high = connection.execute(text('SELECT min(id), max(id) FROM questions')).first()
+
+    renamed = 0
+    for start in range(low or 0, (high or 0) + 1, batch_size):
+        with engine.begin() as connection:
+            renamed += connection.execute(text(
+                'UPDATE questions SET category = c.id::text FROM categories c '
+                'WHERE questions.id >= :start AND questions.id < :end '
+                "AND questions.category !~ '^\\s*[0-9]+\\s*$' "
+                'AND lower(trim(questions.category)) = lower(c.type)'),
+                start=start, end=start + batch_size).rowcount
+
+    unmapped = []
+    for start in range(low or 0, (high or 0) + 1, batch_size):
+        with engine.begin() as connection:
+            unmapped += connection.execute(text(
+                'UPDATE questions SET category = NULL '
+                'WHERE id >= :start AND id < :end AND category IS NOT NULL AND ' + NOT_A_CATEGORY_ID +
+                ' RETURNING id'),
+                start=start, end=start + batch_size).fetchall()
+    return renamed, [row[0] for row in unmapped]
+
+
+if __name__ == '__main__':
+    url = sys.argv[1] if len(sys.argv) > 1 else database_path
+    renamed, unmapped = backfill(create_engine(url))
+    print('{} category names replaced by ids'.format(renamed))
+    if unmapped:
+        print('{} questions without a known category set to NULL: {}'.format(len(unmapped), unmapped))
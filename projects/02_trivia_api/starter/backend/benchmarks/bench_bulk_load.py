@@ -0,0 +1,70 @@
+'''
+bench_bulk_load
+    loads the same synthetic questions twice, once with Question.insert()
+    (one commit per row) and once with Question.bulk_insert() (batched,
+    one commit), and reports rows per second for both
+
+    USAGE (from the backend directory)
+      python -m benchmarks.bench_bulk_load --count 100000
+      python -m benchmarks.bench_bulk_load --database-url sqlite:////tmp/trivia_bench.db
+'''
+import argparse
+import time
+
+from flask import Flask
+
+from models import Question, db, database_path, setup_db
+
+
+def questions(count):
+  for i in range(count):
+    yield {
+      'question': 'Synthetic question number {}?'.format(i),
+      'answer': 'Answer {}'.format(i),
+      'category': i % 6 + 1,
+      'difficulty': i % 5 + 1
+    }
+
+
+def reset():
+  Question.query.delete()
+  db.session.commit()
+
+
+def load_one_by_one(count):
+  for row in questions(count):
+    Question(**row).insert()
+
+
+def load_bulk(count, chunk_size):
+  result = Question.bulk_insert(questions(count), chunk_size=chunk_size)
+  assert not result.failed, result.failed[:3]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--count', type=int, default=100000)
+  parser.add_argument('--chunk-size', type=int, default=1000)
+  parser.add_argument('--database-url', default=database_path)
+  args = parser.parse_args()
+
+  app = Flask(__name__)
+  setup_db(app, args.database_url)
+  with app.app_context():
+    db.create_all()
+    timings = []
+    for name, load in (('insert()', lambda: load_one_by_one(args.count)),
+                       ('bulk_insert()', lambda: load_bulk(args.count, args.chunk_size))):
+      reset()
+      started = time.perf_counter()
+      load()
+      elapsed = time.perf_counter() - started
+      assert Question.query.count() == args.count
+      timings.append(elapsed)
+      print('{:<14} {:>8.2f} s {:>10.0f} rows/s'.format(name, elapsed, args.count / elapsed))
+    reset()
+    print('speedup {:.1f}x'.format(timings[0] / timings[1]))
+
+
+if __name__ == '__main__':
+  main()
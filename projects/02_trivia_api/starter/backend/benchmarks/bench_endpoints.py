@@ -0,0 +1,380 @@
+'''
+bench_endpoints
+    seeds a synthetic question bank and drives every trivia endpoint, first
+    through the Flask test client (application cost only) and then through
+    a threaded WSGI server over HTTP (with the server and client overhead)
+    reports p50/p95/p99 latency and requests per second per endpoint and
+    saves them as JSON, --compare prints the change against an earlier run
+
+    scenarios, in the order they run
+      list       GET /questions?page=N, N within the first pages of the bank
+      cursor     GET /questions?cursor=..., walking next_cursor
+      category   GET /categories/<id>/questions?page=N, N within the pages
+                 of the category
+      search     POST /questions {"searchTerm": ...}
+      quiz       POST /quizzes, playing whole quizzes with a quiz_id
+      create     POST /questions
+      delete     DELETE /questions/<id> of the questions created before,
+                 so the bank keeps its size between drivers
+
+    the bank is seeded with Question.bulk_insert() and reused by later runs
+    when it already holds --size questions
+    latencies are those of the 2xx responses, the others are counted per
+    status apart so a 404 never lands in the percentiles
+
+    USAGE (from the backend directory)
+      python -m benchmarks.bench_endpoints --size 10000
+      python -m benchmarks.bench_endpoints --size 1000000 --database-url postgres://localhost:5432/trivia_bench
+      python -m benchmarks.bench_endpoints --compare benchmarks/results/<earlier run>.json
+'''
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter, deque
+from urllib.error import HTTPError
+
+from werkzeug.serving import make_server
+
+from flaskr import QUESTIONS_PER_PAGE, create_app
+from models import Category, Question, db
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = [
+  'river', 'planet', 'painter', 'novel', 'league', 'capital', 'element',
+  'empire', 'album', 'mountain', 'theorem', 'island', 'actor', 'trophy',
+  'ocean', 'composer', 'dynasty', 'galaxy', 'desert', 'stadium'
+]
+LIST_PAGES = 50
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def synthetic_questions(count):
+  for i in range(count):
+    words = ' '.join(WORDS[(i * k) % len(WORDS)] for k in (1, 3, 7))
+    yield {
+      'question': 'Which {} is number {}?'.format(words, i),
+      'answer': 'Answer {}'.format(i),
+      'category': i % len(CATEGORIES) + 1,
+      'difficulty': i % 5 + 1
+    }
+
+
+def seed(app, size, chunk_size):
+  with app.app_context():
+    db.create_all()
+    if Category.query.count() == 0:
+      for category_type in CATEGORIES:
+        db.session.add(Category(type=category_type))
+      db.session.commit()
+    if Question.query.count() == size:
+      return False
+    Question.query.delete()
+    db.session.commit()
+    result = Question.bulk_insert(synthetic_questions(size), chunk_size=chunk_size)
+    assert not result.failed, result.failed[:3]
+    app.extensions['catalog'].invalidate()
+  return True
+
+
+'''
+Scenarios
+  generators yielding (method, path, json body) and receiving the decoded
+  response of each request, so stateful clients (cursor walks, quizzes)
+  follow the server's answers
+  every worker thread runs its own generator, shared holds the ids of the
+  questions created for the delete scenario, size is the size of the bank
+'''
+def pages(count):
+  # pages of a listing of count questions, at most LIST_PAGES
+  return max(1, min(LIST_PAGES, math.ceil(count / QUESTIONS_PER_PAGE)))
+
+
+def list_scenario(shared, size):
+  while True:
+    yield 'GET', '/questions?page={}'.format(random.randint(1, pages(size))), None
+
+
+def cursor_scenario(shared, size):
+  cursor = None
+  while True:
+    path = '/questions?cursor={}'.format(cursor) if cursor else '/questions'
+    body = yield 'GET', path, None
+    cursor = body.get('next_cursor')
+
+
+def category_scenario(shared, size):
+  # synthetic_questions() spreads the bank evenly over the categories, the
+  # last category holds the fewest
+  last_page = pages(size // len(CATEGORIES))
+  while True:
+    path = '/categories/{}/questions?page={}'.format(
+      random.randint(1, len(CATEGORIES)), random.randint(1, last_page))
+    yield 'GET', path, None
+
+
+def search_scenario(shared, size):
+  while True:
+    yield 'POST', '/questions', {'searchTerm': random.choice(WORDS)}
+
+
+def quiz_scenario(shared, size):
+  while True:
+    category = random.randint(0, len(CATEGORIES))
+    previous, quiz_id = [], None
+    # a quiz in the frontend is 5 questions long
+    for _ in range(5):
+      body = yield 'POST', '/quizzes', {
+        'previous_questions': previous,
+        'quiz_category': {'id': category},
+        'quiz_id': quiz_id
+      }
+      if not body.get('question'):
+        break
+      previous.append(body['question']['id'])
+      quiz_id = body['quiz_id']
+
+
+def create_scenario(shared, size):
+  number = 0
+  while True:
+    body = yield 'POST', '/questions', {
+      'question': 'Benchmark question {}?'.format(number),
+      'answer': 'Benchmark',
+      'category': random.randint(1, len(CATEGORIES)),
+      'difficulty': random.randint(1, 5)
+    }
+    if 'created' in body:
+      shared.append(body['created'])
+    number += 1
+
+
+def delete_scenario(shared, size):
+  while True:
+    try:
+      question_id = shared.popleft()
+    except IndexError:
+      return
+    yield 'DELETE', '/questions/{}'.format(question_id), None
+
+
+SCENARIOS = [
+  ('list', list_scenario),
+  ('cursor', cursor_scenario),
+  ('category', category_scenario),
+  ('search', search_scenario),
+  ('quiz', quiz_scenario),
+  ('create', create_scenario),
+  ('delete', delete_scenario),
+]
+
+
+'''
+Drivers
+  send(method, path, body) returns (status, decoded body)
+'''
+def test_client_driver(app):
+  client = app.test_client()
+
+  def send(method, path, body):
+    response = client.open(path, method=method, json=body)
+    return response.status_code, response.get_json()
+  return send
+
+
+def http_driver(base_url):
+  def send(method, path, body):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+      request.add_header('Content-Type', 'application/json')
+    try:
+      with urllib.request.urlopen(request) as response:
+        return response.status, json.loads(response.read())
+    except HTTPError as error:
+      return error.code, json.loads(error.read() or b'{}')
+  return send
+
+
+def percentile(latencies, fraction):
+  # nearest rank on sorted latencies
+  return latencies[max(0, math.ceil(fraction * len(latencies)) - 1)]
+
+
+def run_scenario(send, scenario, requests, concurrency, shared, size):
+  latencies = []
+  failures = Counter()
+  lock = threading.Lock()
+  remaining = [requests]
+
+  def take():
+    with lock:
+      if remaining[0] <= 0:
+        return False
+      remaining[0] -= 1
+      return True
+
+  def work():
+    local = []
+    local_failures = Counter()
+    generator = scenario(shared, size)
+    try:
+      request = next(generator)
+      while take():
+        started = time.perf_counter()
+        status, body = send(*request)
+        elapsed = time.perf_counter() - started
+        if 200 <= status < 300:
+          local.append(elapsed)
+        else:
+          local_failures[status] += 1
+          body = {}
+        request = generator.send(body or {})
+    except StopIteration:
+      pass
+    with lock:
+      latencies.extend(local)
+      failures.update(local_failures)
+
+  threads = [threading.Thread(target=work) for _ in range(concurrency)]
+  started = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.perf_counter() - started
+
+  latencies.sort()
+  errors = {str(status): count for status, count in sorted(failures.items())}
+  if not latencies:
+    return {'requests': 0, 'errors': errors}
+  return {
+    'requests': len(latencies),
+    'errors': errors,
+    'p50_ms': percentile(latencies, 0.50) * 1000,
+    'p95_ms': percentile(latencies, 0.95) * 1000,
+    'p99_ms': percentile(latencies, 0.99) * 1000,
+    'mean_ms': sum(latencies) / len(latencies) * 1000,
+    'requests_per_second': len(latencies) / elapsed
+  }
+
+
+def run_driver(name, send, requests, concurrency, size):
+  shared = deque()
+  results = {}
+  for scenario_name, scenario in SCENARIOS:
+    if scenario_name not in ('create', 'delete'):
+      # a short warm up loads the catalog, search index and connection pool
+      run_scenario(send, scenario, max(1, requests // 20), concurrency, shared, size)
+    result = run_scenario(send, scenario, requests, concurrency, shared, size)
+    results[scenario_name] = result
+    print_result(name, scenario_name, result)
+  return results
+
+
+def print_result(driver, scenario, result):
+  errors = ', '.join('{} x{}'.format(status, count) for status, count in result['errors'].items())
+  if not result['requests']:
+    print('{:<8} {:<9} no 2xx responses  {}'.format(driver, scenario, errors))
+    return
+  print('{:<8} {:<9} {:>8.2f} {:>8.2f} {:>8.2f} ms {:>9.0f} req/s  {}'.format(
+    driver, scenario, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+    result['requests_per_second'], errors or 'no errors'))
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(
+      ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def compare(previous_path, current):
+  with open(previous_path) as f:
+    previous = json.load(f)
+  print('\nchange against {} ({})'.format(previous_path, previous['meta'].get('commit')))
+  for driver, scenarios in current['results'].items():
+    for scenario, result in scenarios.items():
+      before = previous['results'].get(driver, {}).get(scenario)
+      if not before or not before.get('requests') or not result.get('requests'):
+        continue
+      print('{:<8} {:<9} p95 {:>+7.1f}%  req/s {:>+7.1f}%'.format(
+        driver, scenario,
+        (result['p95_ms'] / before['p95_ms'] - 1) * 100,
+        (result['requests_per_second'] / before['requests_per_second'] - 1) * 100))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--size', type=int, default=10000, help='questions in the bank')
+  parser.add_argument('--database-url', help='defaults to a SQLite file in the temp directory')
+  parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint and driver')
+  parser.add_argument('--concurrency', type=int, default=4, help='client threads of the WSGI driver')
+  parser.add_argument('--drivers', nargs='+', default=['client', 'wsgi'], choices=['client', 'wsgi'])
+  parser.add_argument('--chunk-size', type=int, default=10000)
+  parser.add_argument('--output', help='JSON results file, defaults to benchmarks/results/')
+  parser.add_argument('--compare', help='JSON results of an earlier run')
+  args = parser.parse_args()
+
+  database_url = args.database_url or 'sqlite:///{}'.format(
+    os.path.join(tempfile.gettempdir(), 'trivia_bench_{}.db'.format(args.size)))
+  app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+
+  started = time.perf_counter()
+  if seed(app, args.size, args.chunk_size):
+    print('seeded {} questions in {:.1f} s'.format(args.size, time.perf_counter() - started))
+  print('{:<8} {:<9} {:>8} {:>8} {:>8}'.format('driver', 'endpoint', 'p50', 'p95', 'p99'))
+
+  results = {}
+  if 'client' in args.drivers:
+    # the test client runs in the calling thread, one client at a time
+    results['client'] = run_driver('client', test_client_driver(app), args.requests, 1, args.size)
+  if 'wsgi' in args.drivers:
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+      base_url = 'http://127.0.0.1:{}'.format(server.server_port)
+      results['wsgi'] = run_driver('wsgi', http_driver(base_url), args.requests, args.concurrency, args.size)
+    finally:
+      server.shutdown()
+
+  commit = git_commit()
+  report = {
+    'meta': {
+      'commit': commit,
+      'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+      'size': args.size,
+      'database': db.get_engine(app).dialect.name,
+      'requests': args.requests,
+      'concurrency': args.concurrency,
+      'python': platform.python_version()
+    },
+    'results': results
+  }
+  output = args.output
+  if output is None:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = os.path.join(RESULTS_DIR, 'endpoints-{}-{}-{}.json'.format(
+      report['meta']['database'], args.size, commit or report['meta']['timestamp']))
+  with open(output, 'w') as f:
+    json.dump(report, f, indent=2)
+  print('results saved to {}'.format(output))
+
+  if args.compare:
+    compare(args.compare, report)
+
+
+if __name__ == '__main__':
+  main()
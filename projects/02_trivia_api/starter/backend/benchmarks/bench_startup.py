@@ -0,0 +1,97 @@
+'''
+bench_startup
+    measures a cold start the way a new worker or serverless instance sees
+    it: a fresh interpreter imports flaskr, calls create_app() and serves
+    its first request (GET /categories)
+    every run is a new process, the medians of --runs runs are reported
+    for the import, create_app(), the first request and the whole process
+
+    --baseline runs the same probe against the backend of another git
+    revision (it must accept create_app(test_config)), to compare startup
+    before and after a change
+
+    USAGE (from the backend directory)
+      python -m benchmarks.bench_startup --runs 20
+      python -m benchmarks.bench_startup --baseline HEAD~1
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from models import database_path
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ('import', 'create_app', 'first_request', 'process')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from flaskr import create_app
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created = time.perf_counter()
+response = app.test_client().get('/categories')
+answered = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+  'import': imported - started,
+  'create_app': created - imported,
+  'first_request': answered - created
+}))
+'''
+
+
+def probe(backend_dir, database_url):
+  started = time.perf_counter()
+  output = subprocess.check_output([sys.executable, '-c', PROBE, database_url], cwd=backend_dir)
+  timings = json.loads(output.decode().strip().splitlines()[-1])
+  timings['process'] = time.perf_counter() - started
+  return timings
+
+
+def measure(backend_dir, database_url, runs):
+  samples = [probe(backend_dir, database_url) for _ in range(runs)]
+  return {phase: statistics.median(sample[phase] for sample in samples) for phase in PHASES}
+
+
+def checkout(revision, directory):
+  # extracts the backend folder of revision, without touching the work tree
+  top, prefix = subprocess.check_output(
+    ['git', 'rev-parse', '--show-toplevel', '--show-prefix'], cwd=BACKEND_DIR).decode().splitlines()
+  archive = os.path.join(directory, 'backend.tar')
+  subprocess.check_call(['git', 'archive', '--output', archive, revision, prefix], cwd=top)
+  with tarfile.open(archive) as tar:
+    tar.extractall(directory)
+  return os.path.join(directory, prefix)
+
+
+def report(name, timings):
+  print('{:<10} {}'.format(name, '  '.join(
+    '{} {:>7.1f} ms'.format(phase, timings[phase] * 1000) for phase in PHASES)))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--database-url', default=database_path)
+  parser.add_argument('--baseline', help='git revision to compare against')
+  args = parser.parse_args()
+
+  current = measure(BACKEND_DIR, args.database_url, args.runs)
+  report('current', current)
+  if args.baseline:
+    with tempfile.TemporaryDirectory() as directory:
+      baseline = measure(checkout(args.baseline, directory), args.database_url, args.runs)
+    report(args.baseline, baseline)
+    print('speedup    {}'.format('  '.join(
+      '{} {:>6.2f}x'.format(phase, baseline[phase] / current[phase]) for phase in PHASES)))
+
+
+if __name__ == '__main__':
+  main()
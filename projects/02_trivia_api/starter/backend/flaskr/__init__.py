@@ -4,28 +4,80 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, question_listeners, Question, Category
+from .catalog import ALL_CATEGORIES, CategoryCatalog
+from .pagination import Paginator
+from .quiz import QuizSampler
+from .search import make_search_backend
 
 QUESTIONS_PER_PAGE = 10
 
 def create_app(test_config=None):
   # create and configure the app
+  # test_config overrides any setting, e.g. SQLALCHEMY_DATABASE_URI or
+  # SEARCH_BACKEND; creating the app does not connect to the database
   app = Flask(__name__)
-  setup_db(app)
+  if test_config:
+    app.config.from_mapping(test_config)
+  setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+
+  '''
+  Category catalog
+    category types, question ids and counts shared by the listings and the
+    quiz, loaded by the first request that needs them and kept current by
+    the Question helpers
+    out-of-band writes call app.extensions['catalog'].invalidate()
+  '''
+  catalog = CategoryCatalog()
+  question_listeners(app).append(catalog)
+  app.extensions['catalog'] = catalog
   
   '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
   '''
+  CORS(app, resources={r"/*": {"origins": "*"}})
 
   '''
   @TODO: Use the after_request decorator to set Access-Control-Allow
   '''
+  @app.after_request
+  def after_request(response):
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
+    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    return response
+
+  '''
+  Pagination
+    listings accept ?page=N (LIMIT/OFFSET) or ?cursor=<next_cursor of the
+    previous page> (keyset, constant cost at any depth)
+    total counts and categories are served from the catalog instead of a
+    COUNT(*) and a categories query per request
+  '''
+  question_paginator = Paginator('id', [Question.id], QUESTIONS_PER_PAGE)
+  category_paginator = Paginator('category', [Question.category, Question.id], QUESTIONS_PER_PAGE)
+
+  def paginate_questions(paginator, query):
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', 1, type=int)
+    try:
+      result = paginator.paginate(query, cursor=cursor, page=page)
+    except ValueError:
+      abort(400)
+    if not result.items and (cursor or page > 1):
+      abort(404)
+    return result
 
   '''
   @TODO: 
   Create an endpoint to handle GET requests 
   for all available categories.
   '''
+  @app.route('/categories')
+  def get_categories():
+    return jsonify({
+      'success': True,
+      'categories': catalog.categories()
+    })
 
 
   '''
@@ -40,6 +92,17 @@ def create_app(test_config=None):
   ten questions per page and pagination at the bottom of the screen for three pages.
   Clicking on the page numbers should update the questions. 
   '''
+  @app.route('/questions')
+  def get_questions():
+    result = paginate_questions(question_paginator, Question.query)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in result.items],
+      'total_questions': catalog.count(),
+      'categories': catalog.categories(),
+      'current_category': None,
+      'next_cursor': result.next_cursor
+    })
 
   '''
   @TODO: 
@@ -48,6 +111,17 @@ def create_app(test_config=None):
   TEST: When you click the trash icon next to a question, the question will be removed.
   This removal will persist in the database and when you refresh the page. 
   '''
+  @app.route('/questions/<int:question_id>', methods=['DELETE'])
+  def delete_question(question_id):
+    question = Question.query.get(question_id)
+    if question is None:
+      abort(404)
+
+    question.delete()
+    return jsonify({
+      'success': True,
+      'deleted': question_id
+    })
 
   '''
   @TODO: 
@@ -69,7 +143,59 @@ def create_app(test_config=None):
   TEST: Search by any phrase. The questions list will update to include 
   only question that include that string within their question. 
   Try using the word "title" to start. 
+
+  Searches go through a search backend (see flaskr/search.py), a trigram
+  index in Postgres or an in-memory n-gram index otherwise, picked with
+  the SEARCH_BACKEND setting or from the database in use.
   '''
+  search = None
+
+  def search_backend():
+    nonlocal search
+    if search is None:
+      search = make_search_backend(app.config.get('SEARCH_BACKEND'))
+      if hasattr(search, 'invalidate'):
+        question_listeners(app).append(search)
+    return search
+
+  def search_questions(body):
+    term = body['searchTerm']
+    page = body.get('page', 1)
+    if not isinstance(term, str) or not isinstance(page, int) or page < 1:
+      abort(422)
+    questions, total = search_backend().search(term, page, QUESTIONS_PER_PAGE)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in questions],
+      'total_questions': total,
+      'current_category': None
+    })
+
+  @app.route('/questions', methods=['POST'])
+  def create_or_search_questions():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+      abort(400)
+    if 'searchTerm' in body:
+      return search_questions(body)
+
+    try:
+      question = Question(
+        question=body['question'],
+        answer=body['answer'],
+        category=int(body['category']),
+        difficulty=int(body['difficulty'])
+      )
+    except (KeyError, TypeError, ValueError):
+      abort(422)
+    if not question.question or not question.answer or not catalog.exists(question.category):
+      abort(422)
+
+    question.insert()
+    return jsonify({
+      'success': True,
+      'created': question.id
+    })
 
   '''
   @TODO: 
@@ -79,6 +205,20 @@ def create_app(test_config=None):
   categories in the left column will cause only questions of that 
   category to be shown. 
   '''
+  @app.route('/categories/<int:category_id>/questions')
+  def get_questions_by_category(category_id):
+    if not catalog.exists(category_id):
+      abort(404)
+
+    query = Question.query.filter(Question.category == category_id)
+    result = paginate_questions(category_paginator, query)
+    return jsonify({
+      'success': True,
+      'questions': [question.format() for question in result.items],
+      'total_questions': catalog.count(category_id),
+      'current_category': catalog.categories()[category_id],
+      'next_cursor': result.next_cursor
+    })
 
 
   '''
@@ -91,13 +231,79 @@ def create_app(test_config=None):
   TEST: In the "Play" tab, after a user selects "All" or a category,
   one question at a time is displayed, the user is allowed to answer
   and shown whether they were correct or not. 
+
+  Clients that send "quiz_id" (null on the first question, then the
+  quiz_id of the previous response) draw from a shuffled deck of the
+  category kept on the server, the others get a stateless random draw.
+  Both cost one query per question.
   '''
+  quiz_sampler = QuizSampler(catalog)
+
+  @app.route('/quizzes', methods=['POST'])
+  def play_quiz():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+      abort(400)
+    try:
+      previous_questions = [int(question_id) for question_id in body.get('previous_questions') or []]
+      category = int((body.get('quiz_category') or {}).get('id', ALL_CATEGORIES))
+    except (TypeError, ValueError, AttributeError):
+      abort(422)
+    if category != ALL_CATEGORIES and not catalog.exists(category):
+      abort(404)
+
+    response = {'success': True}
+    if 'quiz_id' in body:
+      question, response['quiz_id'] = quiz_sampler.draw(category, previous_questions, body['quiz_id'])
+    else:
+      question = quiz_sampler.sample(category, previous_questions)
+    response['question'] = question.format() if question else None
+    return jsonify(response)
 
   '''
   @TODO: 
   Create error handlers for all expected errors 
   including 404 and 422. 
   '''
+  @app.errorhandler(400)
+  def bad_request(error):
+    return jsonify({
+      'success': False,
+      'error': 400,
+      'message': 'bad request'
+    }), 400
+
+  @app.errorhandler(404)
+  def not_found(error):
+    return jsonify({
+      'success': False,
+      'error': 404,
+      'message': 'resource not found'
+    }), 404
+
+  @app.errorhandler(405)
+  def method_not_allowed(error):
+    return jsonify({
+      'success': False,
+      'error': 405,
+      'message': 'method not allowed'
+    }), 405
+
+  @app.errorhandler(422)
+  def unprocessable(error):
+    return jsonify({
+      'success': False,
+      'error': 422,
+      'message': 'unprocessable'
+    }), 422
+
+  @app.errorhandler(500)
+  def internal_server_error(error):
+    return jsonify({
+      'success': False,
+      'error': 500,
+      'message': 'internal server error'
+    }), 500
   
   return app
 
@@ -0,0 +1,122 @@
+import threading
+import time
+from bisect import bisect_left
+from array import array
+
+from sqlalchemy import func
+
+from models import db, Question, Category
+
+ALL_CATEGORIES = 0
+
+'''
+CategoryCatalog
+  in-process copy of what the listings and the quiz need to know about
+  categories: the id -> type map and the ids of the questions of every
+  category, kept in compact arrays ordered by id
+  per-category and total question counts are the lengths of those arrays
+
+  the catalog is loaded with two queries and then follows the Question
+  helpers as a question listener: an insert or a delete replaces the
+  arrays it changes with updated copies, an array once handed out is never
+  modified, so a quiz deck can keep dealing from it
+  changes made outside of the helpers (psql, bulk loads) call
+  invalidate(), directly or through
+  models.notify_question_listeners('invalidate'), and the next read reloads
+
+  other processes are caught up with by the reads: at most every
+  check_interval seconds one compares the number of questions and the
+  largest id in the database with the catalog's and reloads when they
+  differ, and a catalog older than ttl seconds is reloaded anyway (a
+  question moved to another category changes neither)
+'''
+class CategoryCatalog:
+  def __init__(self, check_interval=5, ttl=300, clock=time.monotonic):
+    self.check_interval = check_interval
+    self.ttl = ttl
+    self.clock = clock
+    self._types = None
+    self._ids = None
+    self._loaded_at = None
+    self._checked_at = None
+    self._lock = threading.Lock()
+
+  def load(self):
+    types = {category.id: category.type for category in Category.query.order_by(Category.id)}
+    ids = {ALL_CATEGORIES: array('l')}
+    for category_id in types:
+      ids[category_id] = array('l')
+    rows = db.session.query(Question.id, Question.category).order_by(Question.id)
+    for question_id, category in rows:
+      ids[ALL_CATEGORIES].append(question_id)
+      if category is not None:
+        ids.setdefault(category, array('l')).append(question_id)
+    with self._lock:
+      self._types = types
+      self._ids = ids
+      self._loaded_at = self._checked_at = self.clock()
+    return types, ids
+
+  def _loaded(self):
+    types, ids = self._types, self._ids
+    if types is None or ids is None or self._stale(ids[ALL_CATEGORIES]):
+      types, ids = self.load()
+    return types, ids
+
+  def _stale(self, all_ids):
+    now = self.clock()
+    with self._lock:
+      if now - self._checked_at < self.check_interval:
+        return False
+      self._checked_at = now
+    if now - self._loaded_at >= self.ttl:
+      return True
+    count, last_id = db.session.query(func.count(Question.id), func.max(Question.id)).one()
+    return (count, last_id) != (len(all_ids), all_ids[-1] if all_ids else None)
+
+  '''
+  categories()
+    returns {id: type} of every category
+  '''
+  def categories(self):
+    return self._loaded()[0]
+
+  def exists(self, category):
+    return category in self._loaded()[0]
+
+  '''
+  ids(category)
+    returns the ids of the questions of category, or of every question for
+    ALL_CATEGORIES, an array that is never modified (changes replace it)
+  '''
+  def ids(self, category=ALL_CATEGORIES):
+    return self._loaded()[1].get(category, ())
+
+  def count(self, category=ALL_CATEGORIES):
+    return len(self.ids(category))
+
+  def question_inserted(self, question):
+    with self._lock:
+      if self._ids is None:
+        return
+      added = array('l', [question['id']])
+      for category in (ALL_CATEGORIES, question['category']):
+        if category is not None:
+          self._ids[category] = self._ids.get(category, array('l')) + added
+
+  def question_deleted(self, question):
+    with self._lock:
+      if self._ids is None:
+        return
+      for category in (ALL_CATEGORIES, question['category']):
+        ids = self._ids.get(int(category)) if category is not None else None
+        if ids is None:
+          continue
+        position = bisect_left(ids, question['id'])
+        if position < len(ids) and ids[position] == question['id']:
+          self._ids[int(category)] = ids[:position] + ids[position + 1:]
+
+  def invalidate(self):
+    with self._lock:
+      self._types = None
+      self._ids = None
@@ -0,0 +1,90 @@
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+'''
+Cursor tokens
+  a cursor is the sort key of the last row of a page, wrapped in an opaque
+  url safe token together with the name of the ordering it belongs to, so a
+  cursor of the category listing is rejected by the full listing
+  decode_cursor checks the values against the python types of the sort
+  columns (None allowed for nullable ones), a crafted cursor never reaches
+  the query
+'''
+def encode_cursor(ordering, values):
+  payload = json.dumps({'o': ordering, 'v': list(values)}, separators=(',', ':'))
+  return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(ordering, token, types, nullable=()):
+  try:
+    padded = token + '=' * (-len(token) % 4)
+    payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    values = payload['v']
+  except Exception:
+    raise ValueError('invalid cursor')
+  if payload.get('o') != ordering or not isinstance(values, list) or len(values) != len(types):
+    raise ValueError('invalid cursor')
+  for position, (value, expected) in enumerate(zip(values, types)):
+    if value is None and position in nullable:
+      continue
+    # json booleans are ints to isinstance
+    if isinstance(value, bool) or not isinstance(value, expected):
+      raise ValueError('invalid cursor')
+  return values
+
+'''
+Page
+  one page of results
+  items: rows of the page
+  next_cursor: token to request the following page, None on the last page
+'''
+class Page:
+  def __init__(self, items, next_cursor):
+    self.items = items
+    self.next_cursor = next_cursor
+
+'''
+Paginator
+  pages a query over a unique sort key, e.g. (id) or (category, id)
+
+  with a cursor the next page is found with a seek predicate
+  (WHERE (category, id) > (:category, :id) ORDER BY category, id LIMIT n),
+  which walks the index and costs the same on the first and on the
+  thousandth page
+  page numbers fall back to LIMIT/OFFSET, whose cost grows with the depth,
+  for clients that jump to an arbitrary page
+'''
+class Paginator:
+  def __init__(self, name, columns, per_page):
+    self.name = name
+    self.columns = columns
+    self.per_page = per_page
+
+  def cursor_for(self, row):
+    return encode_cursor(self.name, [getattr(row, column.key) for column in self.columns])
+
+  '''
+  paginate(query, cursor=None, page=1)
+    returns the Page after cursor, or page number page if no cursor is given
+    raises ValueError for a malformed cursor or page number
+  '''
+  def paginate(self, query, cursor=None, page=1):
+    query = query.order_by(*self.columns)
+    if cursor:
+      values = decode_cursor(self.name, cursor, [column.type.python_type for column in self.columns],
+                             [n for n, column in enumerate(self.columns) if column.nullable])
+      if len(self.columns) == 1:
+        query = query.filter(self.columns[0] > values[0])
+      else:
+        query = query.filter(tuple_(*self.columns) > tuple_(*values))
+    else:
+      if page < 1:
+        raise ValueError('invalid page')
+      query = query.offset((page - 1) * self.per_page)
+
+    # one extra row tells whether there is a next page without a COUNT
+    rows = query.limit(self.per_page + 1).all()
+    items = rows[:self.per_page]
+    next_cursor = self.cursor_for(items[-1]) if len(rows) > self.per_page else None
+    return Page(items, next_cursor)
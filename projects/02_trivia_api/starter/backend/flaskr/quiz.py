@@ -0,0 +1,219 @@
+import random
+import secrets
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from models import Question
+
+'''
+Deck
+  a shuffled deck of the question ids of a category, dealt by a lazy
+  Fisher-Yates shuffle over the id array the catalog had when the deck was
+  dealt: the catalog never modifies an array it has handed out, so the
+  deck pins it and keeps only how many positions are left and the
+  positions swapped so far, one id per question drawn however big the
+  category
+
+  questions added since are pushed into the deck on the next draw, ids
+  deleted since are skipped (see QuizSampler.draw)
+'''
+class Deck:
+  def __init__(self, category, ids):
+    self.category = category
+    self.ids = ids
+    self.remaining = len(ids)
+    self.swaps = {}
+    self.last_id = ids[-1] if ids else 0
+
+  def __len__(self):
+    return len(self.swaps) + 1
+
+  def _at(self, position):
+    question_id = self.swaps.pop(position, None)
+    return self.ids[position] if question_id is None else question_id
+
+  def pop(self):
+    if not self.remaining:
+      return None
+    last = self.remaining - 1
+    position = random.randrange(self.remaining)
+    question_id = self._at(position)
+    if position != last:
+      self.swaps[position] = self._at(last)
+    self.remaining = last
+    return question_id
+
+  def push(self, question_id):
+    # puts an id (back) into the undealt part of the deck
+    self.swaps[self.remaining] = question_id
+    self.remaining += 1
+
+  def catch_up(self, ids):
+    # pushes the ids of ids, the current array of the category, added
+    # after the deck was dealt (ids only grow at the end)
+    if ids is self.ids or not ids or ids[-1] <= self.last_id:
+      return
+    for question_id in ids[bisect_right(ids, self.last_id):]:
+      self.push(question_id)
+    self.last_id = ids[-1]
+
+'''
+DeckStore
+  the decks of the quizzes being played, evicting the least recently used
+  decks while they hold more than max_ids ids in all: a deck counts one
+  plus the ids it keeps, and every id array pinned by a deck counts once,
+  so fresh quiz_ids cannot pin an unbounded amount of memory
+'''
+class DeckStore:
+  def __init__(self, max_ids=4000000):
+    self.max_ids = max_ids
+    self._decks = OrderedDict()
+    # id(array): [array, number of decks pinning it]
+    self._pinned = {}
+    self._held = 0
+    self._lock = threading.Lock()
+
+  def new(self, category, ids):
+    deck = Deck(category, ids)
+    quiz_id = secrets.token_urlsafe(12)
+    with self._lock:
+      pinned = self._pinned.setdefault(id(ids), [ids, 0])
+      if not pinned[1]:
+        self._held += len(ids)
+      pinned[1] += 1
+      self._decks[quiz_id] = (deck, len(deck))
+      self._held += len(deck)
+      self._trim()
+    return quiz_id, deck
+
+  def get(self, quiz_id):
+    with self._lock:
+      entry = self._decks.get(quiz_id)
+      if entry is None:
+        return None
+      self._decks.move_to_end(quiz_id)
+      return entry[0]
+
+  def update(self, quiz_id):
+    # accounts for the ids a deck gained or lost in a draw
+    with self._lock:
+      entry = self._decks.get(quiz_id)
+      if entry is not None:
+        deck, held = entry
+        self._decks[quiz_id] = (deck, len(deck))
+        self._held += len(deck) - held
+        self._trim()
+
+  def held(self):
+    with self._lock:
+      return self._held
+
+  def _trim(self):
+    while self._held > self.max_ids and len(self._decks) > 1:
+      _, (deck, held) = self._decks.popitem(last=False)
+      self._held -= held
+      pinned = self._pinned[id(deck.ids)]
+      pinned[1] -= 1
+      if not pinned[1]:
+        del self._pinned[id(deck.ids)]
+        self._held -= len(deck.ids)
+
+def _contains(ids, question_id):
+  position = bisect_left(ids, question_id)
+  return position < len(ids) and ids[position] == question_id
+
+'''
+QuizSampler
+  draws a random question of a category that is not in previous_questions
+
+  with a quiz_id the player gets a shuffled deck of the category, every
+  draw pops a random remaining id in O(log n) however far into the quiz
+  the player is
+  without one, a few random probes are tried before falling back to
+  filtering the ids in memory, so seen questions never cause a retry loop
+  against the database
+  either way a draw fetches its question with a single query on the
+  primary key, the candidates fetched include a couple of spares so a
+  question deleted behind the catalog's back does not cost another query,
+  and when every candidate was deleted the catalog is reloaded and the
+  draw retried
+'''
+class QuizSampler:
+  probes = 8
+  spares = 2
+  attempts = 3
+
+  def __init__(self, catalog, decks=None):
+    self.catalog = catalog
+    self.decks = decks if decks is not None else DeckStore()
+
+  '''
+  draw(category, previous_questions, quiz_id=None)
+    draws from the deck of quiz_id, starting a new deck if it is unknown
+    returns (question or None when the category is exhausted, quiz_id)
+  '''
+  def draw(self, category, previous_questions, quiz_id=None):
+    excluded = set(previous_questions)
+    deck = self.decks.get(quiz_id) if quiz_id else None
+    if deck is None or deck.category != category:
+      quiz_id, deck = self.decks.new(category, self.catalog.ids(category))
+
+    question = None
+    for _ in range(self.attempts):
+      ids = self.catalog.ids(category)
+      deck.catch_up(ids)
+      candidates = []
+      while len(candidates) <= self.spares:
+        question_id = deck.pop()
+        if question_id is None:
+          break
+        # ids the catalog no longer has were deleted since the deal
+        if question_id not in excluded and _contains(ids, question_id):
+          candidates.append(question_id)
+      question = self._fetch_first(candidates)
+      if question is not None:
+        # spares that were not used go back into the deck
+        for unused in candidates[candidates.index(question.id) + 1:]:
+          deck.push(unused)
+        break
+      if not candidates:
+        break
+    self.decks.update(quiz_id)
+    return question, quiz_id
+
+  '''
+  sample(category, previous_questions)
+    stateless draw for clients that do not keep a quiz_id
+    returns a question or None when the category is exhausted
+  '''
+  def sample(self, category, previous_questions):
+    excluded = set(previous_questions)
+    for _ in range(self.attempts):
+      ids = self.catalog.ids(category)
+      candidates = []
+      for _ in range(self.probes):
+        if not ids or len(candidates) > self.spares:
+          break
+        question_id = ids[random.randrange(len(ids))]
+        if question_id not in excluded and question_id not in candidates:
+          candidates.append(question_id)
+      if not candidates:
+        # most of the category has been seen, probing would keep missing
+        remaining = [question_id for question_id in ids if question_id not in excluded]
+        candidates = random.sample(remaining, min(len(remaining), self.spares + 1))
+      question = self._fetch_first(candidates)
+      if question is not None or not candidates:
+        return question
+    return None
+
+  def _fetch_first(self, candidates):
+    if not candidates:
+      return None
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(candidates))}
+    for candidate in candidates:
+      if candidate in questions:
+        return questions[candidate]
+    # every candidate was deleted out of band, the next ids() reloads
+    self.catalog.invalidate()
+    return None
@@ -0,0 +1,176 @@
+import threading
+from abc import ABC, abstractmethod
+
+from sqlalchemy import func
+
+from models import db, Question
+
+'''
+Question search
+  search backends answer case-insensitive substring searches over
+  Question.question, ranked by where the term appears (earlier first), then
+  by the length of the question (tighter matches first), then by id
+  search(term, page, per_page) returns (questions of the page, total)
+'''
+class SearchBackend(ABC):
+  @abstractmethod
+  def search(self, term, page=1, per_page=10):
+    pass
+
+'''
+PostgresSearch
+  ILIKE '%term%' answered by the pg_trgm GIN index on questions.question
+  created by migrations/001_question_search_index.sql, without the index
+  Postgres falls back to a sequential scan
+'''
+class PostgresSearch(SearchBackend):
+  def search(self, term, page=1, per_page=10):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    query = Question.query.filter(Question.question.ilike('%' + escaped + '%'))
+    total = query.count()
+    questions = query.order_by(
+      func.strpos(func.lower(Question.question), term.lower()),
+      func.length(Question.question),
+      Question.id
+    ).offset((page - 1) * per_page).limit(per_page).all()
+    return questions, total
+
+'''
+NgramSearch
+  in-memory inverted index from character trigrams of the lowercased
+  question to question ids, for SQLite and tests
+  a search intersects the postings of the trigrams of the term, starting
+  with the rarest, and confirms the candidates with a substring test
+  terms shorter than a trigram scan the indexed texts
+  the index is loaded with one query on first use and follows the Question
+  helpers as a question listener
+  inserts and deletes heard while a load is running are replayed on the
+  loaded index, since its query may predate them, and a load that an
+  invalidate() overtook is used by the searches that ran it but not kept
+'''
+class NgramSearch(SearchBackend):
+  n = 3
+
+  def __init__(self):
+    self._texts = None
+    self._postings = None
+    # bumped by invalidate(), a load only keeps its index if unchanged
+    self._generation = 0
+    # loads running, and the events heard meanwhile
+    self._loads = 0
+    self._events = []
+    self._lock = threading.Lock()
+
+  @classmethod
+  def ngrams(cls, text):
+    return {text[i:i + cls.n] for i in range(len(text) - cls.n + 1)}
+
+  '''
+  load()
+    reads every question and returns the (texts, postings) snapshot
+  '''
+  def load(self):
+    with self._lock:
+      generation = self._generation
+      self._loads += 1
+    try:
+      texts = {}
+      postings = {}
+      for question_id, question in db.session.query(Question.id, Question.question):
+        self._add(texts, postings, question_id, question)
+    except Exception:
+      with self._lock:
+        self._loaded()
+      raise
+    with self._lock:
+      for event, question in self._events:
+        if event == 'question_inserted':
+          self._add(texts, postings, question['id'], question['question'])
+        else:
+          self._remove(texts, postings, question['id'])
+      if generation == self._generation and self._texts is None:
+        self._texts = texts
+        self._postings = postings
+      self._loaded()
+    return texts, postings
+
+  def _loaded(self):
+    self._loads -= 1
+    if not self._loads:
+      self._events = []
+
+  def _add(self, texts, postings, question_id, question):
+    text = (question or '').lower()
+    texts[question_id] = text
+    for ngram in self.ngrams(text):
+      postings.setdefault(ngram, set()).add(question_id)
+
+  def search(self, term, page=1, per_page=10):
+    with self._lock:
+      texts, postings = self._texts, self._postings
+    if texts is None:
+      texts, postings = self.load()
+    term = term.lower()
+    with self._lock:
+      ngrams = self.ngrams(term)
+      if ngrams:
+        sets = sorted((postings.get(ngram, set()) for ngram in ngrams), key=len)
+        candidates = set.intersection(*sets) if sets[0] else set()
+      else:
+        candidates = texts.keys()
+      matches = []
+      for question_id in candidates:
+        position = texts[question_id].find(term)
+        if position >= 0:
+          matches.append((position, len(texts[question_id]), question_id))
+
+    matches.sort()
+    page_ids = [question_id for _, _, question_id in matches[(page - 1) * per_page:page * per_page]]
+    if not page_ids:
+      return [], len(matches)
+    questions = {q.id: q for q in Question.query.filter(Question.id.in_(page_ids))}
+    return [questions[i] for i in page_ids if i in questions], len(matches)
+
+  def question_inserted(self, question):
+    with self._lock:
+      if self._texts is not None:
+        self._add(self._texts, self._postings, question['id'], question['question'])
+      elif self._loads:
+        self._events.append(('question_inserted', question))
+
+  def question_deleted(self, question):
+    with self._lock:
+      if self._texts is not None:
+        self._remove(self._texts, self._postings, question['id'])
+      elif self._loads:
+        self._events.append(('question_deleted', question))
+
+  def _remove(self, texts, postings, question_id):
+    text = texts.pop(question_id, None)
+    if text is None:
+      return
+    for ngram in self.ngrams(text):
+      ids = postings.get(ngram)
+      if ids is not None:
+        ids.discard(question_id)
+        if not ids:
+          del postings[ngram]
+
+  def invalidate(self):
+    with self._lock:
+      self._generation += 1
+      self._texts = None
+      self._postings = None
+
+'''
+make_search_backend(name)
+  'postgres', 'ngram', or None to pick from the database in use
+'''
+def make_search_backend(name=None):
+  if name is None:
+    name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'ngram'
+  if name == 'postgres':
+    return PostgresSearch()
+  if name == 'ngram':
+    return NgramSearch()
+  raise ValueError('unknown search backend {}'.format(name))
@@ -0,0 +1,43 @@
+import os
+import sys
+from glob import glob
+
+from sqlalchemy import create_engine, text
+
+from models import database_path
+
+migrations_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+'''
+migrate(engine)
+    applies the SQL files of ./migrations in name order, each one once
+    applied files are recorded in the schema_migrations table
+    the migrations are written for Postgres, other databases are skipped
+    returns the names of the files applied
+'''
+def migrate(engine):
+    if engine.dialect.name != 'postgresql':
+        return []
+
+    applied = []
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())'))
+        done = {row[0] for row in connection.execute(text('SELECT name FROM schema_migrations'))}
+
+    for path in sorted(glob(os.path.join(migrations_dir, '*.sql'))):
+        name = os.path.basename(path)
+        if name in done:
+            continue
+        with open(path) as migration, engine.begin() as connection:
+            connection.execute(text(migration.read()))
+            connection.execute(text('INSERT INTO schema_migrations (name) VALUES (:name)'), name=name)
+        applied.append(name)
+    return applied
+
+
+if __name__ == '__main__':
+    url = sys.argv[1] if len(sys.argv) > 1 else database_path
+    for name in migrate(create_engine(url)):
+        print('applied', name)
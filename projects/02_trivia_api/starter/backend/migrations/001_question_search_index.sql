@@ -0,0 +1,6 @@
+-- Trigram index for case-insensitive substring search on questions.question
+-- lets ILIKE '%term%' use an index scan instead of reading the whole table
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS questions_question_trgm_idx
+    ON questions USING gin (question gin_trgm_ops);
@@ -0,0 +1,23 @@
+-- questions.category becomes an integer foreign key to categories.id
+-- databases restored from dumps that stored the category as text must run
+-- backfill_question_category.py first so every value is a category id
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE questions ALTER COLUMN category TYPE integer
+            USING NULLIF(trim(category), '')::integer;
+    END IF;
+END $$;
+
+-- trivia.psql names its foreign key "category", create_all names it questions_category_fkey
+ALTER TABLE questions DROP CONSTRAINT IF EXISTS category;
+ALTER TABLE questions DROP CONSTRAINT IF EXISTS questions_category_fkey;
+ALTER TABLE questions ADD CONSTRAINT questions_category_fkey
+    FOREIGN KEY (category) REFERENCES categories (id) ON UPDATE CASCADE ON DELETE SET NULL;
+
+-- category listings and quiz draws filter on category and walk ids in order
+CREATE INDEX IF NOT EXISTS questions_category_id_idx ON questions (category, id);
+CREATE INDEX IF NOT EXISTS questions_difficulty_idx ON questions (difficulty);
+
+ANALYZE questions;
@@ -1,35 +1,188 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine
+from sqlalchemy.exc import DBAPIError
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+import click
 import json
 
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
 
-db = SQLAlchemy()
+'''
+SharedEngineSQLAlchemy
+    SQLAlchemy service whose engines are shared by every app of the process
+    with the same database url and engine options, so the apps created by
+    each test case or by several create_app() calls reuse one connection
+    pool instead of opening their own
+    engines are still created on first use, not when an app is set up
+'''
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    _engines = {}
+    _engines_lock = threading.Lock()
+
+    def create_engine(self, sa_url, engine_opts):
+        key = (str(sa_url), repr(sorted(engine_opts.items())))
+        with self._engines_lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = self._engines[key] = super().create_engine(sa_url, engine_opts)
+            return engine
+
+db = SharedEngineSQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    nothing connects to the database here, tables are created by the
+    init-db command (flask init-db) or restored from trivia.psql
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    app.cli.add_command(init_db_command)
+
+'''
+flask init-db
+    creates the missing tables and applies the migrations of ./migrations
+'''
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    from migrate import migrate
     db.create_all()
+    for name in migrate(db.engine):
+        click.echo('applied {}'.format(name))
+    click.echo('database ready')
 
 '''
-Question
+unit_of_work()
+    groups model changes into one transaction that is committed once
+    insert(), update() and delete() called inside the block do not commit,
+    the whole block is committed when it exits or rolled back on error
+    blocks can be nested, only the outermost one commits
+    EXAMPLE
+      with unit_of_work():
+        for question in questions:
+          question.insert()
+'''
+@contextmanager
+def unit_of_work():
+  session = db.session
+  depth = session.info.get('unit_of_work', 0)
+  session.info['unit_of_work'] = depth + 1
+  try:
+    yield session
+    if depth == 0:
+      session.commit()
+  except:
+    if depth == 0:
+      session.rollback()
+      session.info.pop('after_commit', None)
+    raise
+  finally:
+    session.info['unit_of_work'] = depth
+  if depth == 0:
+    for callback in session.info.pop('after_commit', []):
+      callback()
 
 '''
+commit()
+    commits the session unless a unit_of_work() is in progress
+'''
+def commit():
+  if not db.session.info.get('unit_of_work'):
+    db.session.commit()
+
+'''
+after_commit(callback)
+    runs callback once the current changes are committed, right away
+    outside of a unit_of_work(), when the outermost block commits inside one
+'''
+def after_commit(callback):
+  if db.session.info.get('unit_of_work'):
+    db.session.info.setdefault('after_commit', []).append(callback)
+  else:
+    callback()
+
+'''
+question_listeners(app)
+    in-process indexes built from the questions table (quiz decks, ...)
+    of an app, append to the list to follow the changes committed through
+    the Question helpers while the app is current, a listener implements
+      question_inserted(question): question is the format() of the new row
+      question_deleted(question): question is the format() of the old row
+      invalidate(): rows changed in bulk or out of band, rebuild from the db
+    the list lives in app.extensions and goes away with the app, changes
+    committed by other processes are not heard (see CategoryCatalog)
+'''
+def question_listeners(app):
+  return app.extensions.setdefault('question_listeners', [])
+
+def notify_question_listeners(event, *args):
+  if not has_app_context():
+    return
+  for listener in question_listeners(current_app):
+    getattr(listener, event)(*args)
+
+'''
+BulkResult
+    outcome of a bulk_insert() or bulk_delete()
+    succeeded: number of rows written
+    failed: list of (row, error message) for the rows that were rejected
+'''
+BulkResult = namedtuple('BulkResult', ['succeeded', 'failed'])
+
+'''
+bulk_apply(rows, apply, chunk_size)
+    runs apply(chunk) for every chunk of rows inside its own savepoint
+    a chunk that fails is rolled back and replayed row by row, so one bad
+    row only rejects itself and the rest of the batch is still written
+    everything is committed once at the end, see unit_of_work()
+'''
+def bulk_apply(rows, apply, chunk_size=1000):
+  succeeded = 0
+  failed = []
+  rows = iter(rows)
+  with unit_of_work() as session:
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+      try:
+        with session.begin_nested():
+          succeeded += apply(chunk)
+      except DBAPIError:
+        for row in chunk:
+          try:
+            with session.begin_nested():
+              succeeded += apply([row])
+          except DBAPIError as error:
+            failed.append((row, str(error.orig)))
+  return BulkResult(succeeded, failed)
+
+'''
+Question
+  category references categories.id, the (category, id) index serves the
+  category listing and its keyset pages, difficulty has an index of its own
+  existing databases are converted by migrations/002_question_category_fk.sql
+  after running backfill_question_category.py
+'''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  __table_args__ = (
+    Index('questions_category_id_idx', 'category', 'id'),
+    Index('questions_difficulty_idx', 'difficulty'),
+  )
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -40,14 +193,55 @@ class Question(db.Model):
 
   def insert(self):
     db.session.add(self)
-    db.session.commit()
+    db.session.flush()
+    question = self.format()
+    commit()
+    after_commit(lambda: notify_question_listeners('question_inserted', question))
   
   def update(self):
-    db.session.commit()
+    commit()
+    after_commit(lambda: notify_question_listeners('invalidate'))
 
   def delete(self):
+    question = self.format()
     db.session.delete(self)
-    db.session.commit()
+    commit()
+    after_commit(lambda: notify_question_listeners('question_deleted', question))
+
+  '''
+  bulk_insert(rows)
+      inserts questions in batches with one commit, rows are Question
+      instances or dicts of column values
+      returns a BulkResult
+      EXAMPLE
+        Question.bulk_insert([{'question': q, 'answer': a, 'category': 1, 'difficulty': 2}])
+  '''
+  @classmethod
+  def bulk_insert(cls, rows, chunk_size=1000):
+    def apply(chunk):
+      mappings = [row for row in chunk if isinstance(row, dict)]
+      objects = [row for row in chunk if not isinstance(row, dict)]
+      if mappings:
+        db.session.bulk_insert_mappings(cls, mappings)
+      if objects:
+        db.session.bulk_save_objects(objects)
+      return len(chunk)
+    result = bulk_apply(rows, apply, chunk_size)
+    after_commit(lambda: notify_question_listeners('invalidate'))
+    return result
+
+  '''
+  bulk_delete(ids)
+      deletes questions by id with set based DELETE statements and one commit
+      returns a BulkResult, ids that do not exist are not counted
+  '''
+  @classmethod
+  def bulk_delete(cls, ids, chunk_size=1000):
+    def apply(chunk):
+      return cls.query.filter(cls.id.in_(chunk)).delete(synchronize_session=False)
+    result = bulk_apply(ids, apply, chunk_size)
+    after_commit(lambda: notify_question_listeners('invalidate'))
+    return result
 
   def format(self):
     return {
@@ -1,10 +1,13 @@
 import os
 import unittest
 import json
+from array import array
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.pagination import encode_cursor
+from flaskr.quiz import Deck, DeckStore, QuizSampler
+from models import db, unit_of_work, Question, Category
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,18 +15,12 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        # every test case gets a fresh app, the engine behind it is shared
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        self.client = self.app.test_client
+        self.db = db
     
     def tearDown(self):
         """Executed after reach test"""
@@ -34,6 +31,345 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_create_app_does_not_connect(self):
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'postgres://localhost:1/unreachable'})
+        self.assertEqual(app.config['SQLALCHEMY_DATABASE_URI'], 'postgres://localhost:1/unreachable')
+
+    def test_apps_share_one_engine(self):
+        other = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        with self.app.app_context():
+            engine = db.engine
+        with other.app_context():
+            self.assertIs(db.engine, engine)
+
+    def test_get_paginated_questions(self):
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertTrue(data['total_questions'])
+        self.assertTrue(data['categories'])
+        self.assertTrue(data['next_cursor'])
+
+    def test_cursor_pagination_walks_every_question_once(self):
+        seen = []
+        url = '/questions'
+        while url:
+            data = json.loads(self.client().get(url).data)
+            seen.extend(question['id'] for question in data['questions'])
+            url = data['next_cursor'] and '/questions?cursor=' + data['next_cursor']
+
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), data['total_questions'])
+
+    def test_cursor_matches_page_numbers(self):
+        first = json.loads(self.client().get('/questions?page=1').data)
+        by_cursor = json.loads(self.client().get('/questions?cursor=' + first['next_cursor']).data)
+        by_page = json.loads(self.client().get('/questions?page=2').data)
+
+        self.assertEqual(by_cursor['questions'], by_page['questions'])
+
+    def test_400_for_invalid_cursor(self):
+        res = self.client().get('/questions?cursor=not-a-cursor')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_400_for_cursor_values_of_the_wrong_type(self):
+        for values in ([{'id': 1}], [[1]], ['1'], [True], [1, 2]):
+            res = self.client().get('/questions?cursor=' + encode_cursor('id', values))
+
+            self.assertEqual(res.status_code, 400)
+
+    def test_404_sent_requesting_beyond_valid_page(self):
+        res = self.client().get('/questions?page=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_get_questions_by_category(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['current_category'], 'Science')
+        self.assertTrue(all(int(q['category']) == 1 for q in data['questions']))
+        self.assertEqual(data['total_questions'], len(data['questions']))
+
+    def test_404_for_questions_of_missing_category(self):
+        res = self.client().get('/categories/1000/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_create_and_delete_question(self):
+        res = self.client().post('/questions', json={
+            'question': 'What is the boiling point of water in Celsius?',
+            'answer': '100',
+            'category': '1',
+            'difficulty': 1
+        })
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+
+        res = self.client().delete('/questions/{}'.format(data['created']))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['deleted'], data['created'])
+        with self.app.app_context():
+            self.assertIsNone(Question.query.get(data['created']))
+
+    def test_get_categories(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['categories']['1'], 'Science')
+
+    def test_catalog_counts_follow_inserts_and_deletes(self):
+        total = lambda url: json.loads(self.client().get(url).data)['total_questions']
+        before = (total('/questions'), total('/categories/2/questions'))
+
+        created = json.loads(self.client().post('/questions', json={
+            'question': 'Who painted the Night Watch?', 'answer': 'Rembrandt', 'category': 2, 'difficulty': 2
+        }).data)['created']
+        self.assertEqual((total('/questions'), total('/categories/2/questions')), (before[0] + 1, before[1] + 1))
+
+        self.client().delete('/questions/{}'.format(created))
+        self.assertEqual((total('/questions'), total('/categories/2/questions')), before)
+
+    def test_422_if_question_creation_fails(self):
+        res = self.client().post('/questions', json={'question': 'No answer?', 'category': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_404_if_question_does_not_exist(self):
+        res = self.client().delete('/questions/1000000')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_search_questions(self):
+        for backend in ('postgres', 'ngram'):
+            app = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path, 'SEARCH_BACKEND': backend})
+            client = app.test_client()
+
+            data = json.loads(client.post('/questions', json={'searchTerm': 'TITLE'}).data)
+            self.assertEqual(data['total_questions'], 2)
+            self.assertTrue(all('title' in q['question'].lower() for q in data['questions']))
+
+            data = json.loads(client.post('/questions', json={'searchTerm': 'zzzz'}).data)
+            self.assertEqual(data['total_questions'], 0)
+            self.assertEqual(data['questions'], [])
+
+    def test_search_index_follows_inserts_and_deletes(self):
+        self.app.config['SEARCH_BACKEND'] = 'ngram'
+        search = lambda: json.loads(self.client().post('/questions', json={'searchTerm': 'platypus'}).data)
+        self.assertEqual(search()['total_questions'], 0)
+
+        created = json.loads(self.client().post('/questions', json={
+            'question': 'Which mammal is a Platypus?', 'answer': 'Monotreme', 'category': 1, 'difficulty': 2
+        }).data)['created']
+        self.assertEqual([q['id'] for q in search()['questions']], [created])
+
+        self.client().delete('/questions/{}'.format(created))
+        self.assertEqual(search()['total_questions'], 0)
+
+    def test_play_quiz(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [20],
+            'quiz_category': {'type': 'Science', 'id': '1'}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(int(data['question']['category']), 1)
+        self.assertNotEqual(data['question']['id'], 20)
+
+    def test_quiz_never_repeats_and_ends(self):
+        for state in ({}, {'quiz_id': None}):
+            previous = []
+            while True:
+                body = dict(state, previous_questions=previous, quiz_category={'type': 'click', 'id': 0})
+                data = json.loads(self.client().post('/quizzes', json=body).data)
+                if data['question'] is None:
+                    break
+                self.assertNotIn(data['question']['id'], previous)
+                previous.append(data['question']['id'])
+                if 'quiz_id' in state:
+                    state = {'quiz_id': data['quiz_id']}
+
+            with self.app.app_context():
+                self.assertEqual(len(previous), Question.query.count())
+
+    def test_404_quiz_for_missing_category(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Nope', 'id': 1000}
+        })
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_deck_deals_every_id_once(self):
+        ids = array('l', range(1, 1001))
+        deck = Deck(1, ids)
+        dealt = []
+        for draw in range(2000):
+            question_id = deck.pop()
+            if question_id is None:
+                break
+            if draw % 7 == 0:
+                # a spare that was not used goes back
+                deck.push(question_id)
+            else:
+                dealt.append(question_id)
+        self.assertEqual(sorted(dealt), list(ids))
+
+    def test_deck_deals_questions_added_after_the_deal(self):
+        ids = array('l', range(1, 11))
+        deck = Deck(1, ids)
+        dealt = [deck.pop() for _ in range(5)]
+        deck.catch_up(ids + array('l', [11, 12]))
+        while True:
+            question_id = deck.pop()
+            if question_id is None:
+                break
+            dealt.append(question_id)
+        self.assertEqual(sorted(dealt), list(range(1, 13)))
+
+    def test_deck_store_is_bounded_by_ids_held(self):
+        decks = DeckStore(max_ids=1000)
+        for n in range(200):
+            # a new array per deck, as if a question was added in between
+            ids = array('l', range(1, 101 + n))
+            quiz_id, deck = decks.new(1, ids)
+            for _ in range(5):
+                deck.pop()
+            decks.update(quiz_id)
+        self.assertLessEqual(decks.held(), 1000)
+
+    def test_quiz_retries_when_drawn_questions_were_deleted(self):
+        class StaleCatalog:
+            # ids of deleted questions until the catalog is reloaded
+            def __init__(self, stale, fresh):
+                self.current, self.fresh = stale, fresh
+
+            def ids(self, category):
+                return self.current
+
+            def invalidate(self):
+                self.current = self.fresh
+
+        with self.app.app_context():
+            existing = Question.query.first()
+            # deleted out of band, the question was added after them
+            deleted = array('l', range(-5, 0))
+            for draw in ('draw', 'sample'):
+                sampler = QuizSampler(StaleCatalog(deleted, array('l', [existing.id])))
+                if draw == 'draw':
+                    question, _ = sampler.draw(0, [], None)
+                else:
+                    question = sampler.sample(0, [])
+                self.assertEqual(question.id, existing.id)
+
+    def test_bulk_insert_and_delete_questions(self):
+        rows = [{
+            'question': 'Bulk question {}?'.format(i),
+            'answer': 'Answer',
+            'category': 1,
+            'difficulty': 1
+        } for i in range(5)]
+        with self.app.app_context():
+            before = Question.query.count()
+            result = Question.bulk_insert(rows, chunk_size=2)
+            self.assertEqual(result.succeeded, 5)
+            self.assertEqual(result.failed, [])
+            self.assertEqual(Question.query.count(), before + 5)
+
+            ids = [q.id for q in Question.query.filter(Question.question.like('Bulk question%'))]
+            result = Question.bulk_delete(ids + [999999])
+            self.assertEqual(result.succeeded, 5)
+            self.assertEqual(Question.query.count(), before)
+
+    def test_catalog_sees_questions_added_by_another_worker(self):
+        other = create_app({'SQLALCHEMY_DATABASE_URI': self.database_path})
+        catalog = self.app.extensions['catalog']
+        now = [0]
+        catalog.clock = lambda: now[0]
+        with self.app.app_context():
+            before = catalog.count()
+        with other.app_context():
+            Question('Other worker?', 'Yes', 1, 1).insert()
+        try:
+            with self.app.app_context():
+                # the other app's listeners are not this app's
+                self.assertEqual(catalog.count(), before)
+                now[0] += catalog.check_interval
+                self.assertEqual(catalog.count(), before + 1)
+        finally:
+            with other.app_context():
+                Question.query.filter_by(question='Other worker?').one().delete()
+
+    def test_bulk_insert_rejects_only_bad_rows(self):
+        with self.app.app_context():
+            existing_id = Question.query.first().id
+            before = Question.query.count()
+            rows = [
+                {'question': 'Good?', 'answer': 'Yes', 'category': 1, 'difficulty': 1},
+                {'id': existing_id, 'question': 'Duplicate?', 'answer': 'No', 'category': 1, 'difficulty': 1},
+            ]
+            result = Question.bulk_insert(rows)
+            self.assertEqual(result.succeeded, 1)
+            self.assertEqual(len(result.failed), 1)
+            self.assertEqual(result.failed[0][0]['question'], 'Duplicate?')
+            self.assertEqual(Question.query.count(), before + 1)
+            Question.bulk_delete([q.id for q in Question.query.filter_by(question='Good?')])
+
+    def explain(self, query):
+        """EXPLAIN of an ORM query, with sequential scans discouraged so the
+        small test database plans like a large one."""
+        statement = query.statement.compile(
+            dialect=self.db.engine.dialect, compile_kwargs={'literal_binds': True})
+        with self.db.engine.connect() as connection:
+            connection.execute('SET enable_seqscan = off')
+            plan = connection.execute('EXPLAIN ' + str(statement)).fetchall()
+        return '\n'.join(row[0] for row in plan)
+
+    def test_category_and_quiz_queries_use_indexes(self):
+        with self.app.app_context():
+            listing = Question.query.filter(Question.category == 1) \
+                .order_by(Question.category, Question.id).limit(11)
+            plan = self.explain(listing)
+            self.assertIn('questions_category_id_idx', plan)
+            self.assertNotIn('Seq Scan on questions', plan)
+
+            ids = [q.id for q in Question.query.limit(3)]
+            plan = self.explain(Question.query.filter(Question.id.in_(ids)))
+            self.assertIn('Index', plan)
+            self.assertNotIn('Seq Scan on questions', plan)
+
+            plan = self.explain(Question.query.filter(Question.difficulty == 1))
+            self.assertIn('questions_difficulty_idx', plan)
+
+    def test_unit_of_work_rolls_back_on_error(self):
+        with self.app.app_context():
+            before = Question.query.count()
+            with self.assertRaises(RuntimeError):
+                with unit_of_work():
+                    Question('Rolled back?', 'Yes', 1, 1).insert()
+                    raise RuntimeError()
+            self.assertEqual(Question.query.count(), before)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+'''
+stress_sqlite
+    runs parallel reader and writer processes against the Drink model, once
+    per SQLite profile of setup_db, and reports the throughput of each role
+    and the number of "database is locked" failures
+
+    readers serialize the whole menu, writers update seeded drinks so the
+    table size stays constant during the run
+    every process builds its own app and engine, like gunicorn workers do
+    USAGE (from the backend directory)
+        python -m benchmarks.stress_sqlite --readers 6 --writers 2 --seconds 10
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import SQLITE_PROFILES, Drink, db, setup_db
+
+RECIPE = json.dumps([{'name': 'espresso', 'color': 'brown', 'parts': 1}])
+
+
+def make_app(database_path, profile):
+    app = Flask(__name__)
+    setup_db(app, database_path, profile=profile)
+    return app
+
+
+def worker(role, number, database_path, profile, seconds, seed, results):
+    app = make_app(database_path, profile)
+    operations = 0
+    locked = 0
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            try:
+                if role == 'reader':
+                    Drink.bulk_short(Drink.query.all())
+                else:
+                    drink = Drink.query.get(operations % seed + 1)
+                    drink.title = 'seed-{}-{}-{}'.format(drink.id, number, operations)
+                    drink.update()
+                operations += 1
+            except OperationalError as error:
+                db.session.rollback()
+                if 'locked' not in str(error):
+                    raise
+                locked += 1
+    results.put((role, operations, locked))
+
+
+def run(profile, readers, writers, seconds, seed):
+    directory = tempfile.mkdtemp()
+    database_path = 'sqlite:///{}'.format(os.path.join(directory, 'stress.db'))
+    app = make_app(database_path, profile)
+    with app.app_context():
+        db.create_all()
+        for i in range(seed):
+            db.session.add(Drink(title='seed-{}'.format(i), recipe=RECIPE))
+        db.session.commit()
+        db.session.remove()
+        db.get_engine(app).dispose()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(role, number, database_path, profile, seconds, seed, results))
+        for number, role in enumerate(['reader'] * readers + ['writer'] * writers)
+    ]
+    for process in processes:
+        process.start()
+    totals = {'reader': [0, 0], 'writer': [0, 0]}
+    for _ in processes:
+        role, operations, locked = results.get()
+        totals[role][0] += operations
+        totals[role][1] += locked
+    for process in processes:
+        process.join()
+
+    for role, (operations, locked) in totals.items():
+        print('{:<8} {:<7} {:>10.0f} ops/s {:>8} locked'.format(
+            profile, role, operations / seconds, locked))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=200, help='drinks created before the run')
+    parser.add_argument('--profiles', nargs='+', default=list(SQLITE_PROFILES))
+    args = parser.parse_args()
+
+    for profile in args.profiles:
+        run(profile, args.readers, args.writers, args.seconds, args.seed)
+
+
+if __name__ == '__main__':
+    main()
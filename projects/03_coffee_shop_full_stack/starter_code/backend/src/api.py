@@ -1,16 +1,19 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.models import db_drop_and_create_all, setup_db, Drink, MenuVersion
 from .auth.auth import AuthError, requires_auth
+from .menu_cache import MenuCache
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
 
+menu_cache = MenuCache()
+
 '''
 @TODO uncomment the following line to initialize the datbase
 !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
@@ -19,6 +22,31 @@ CORS(app)
 # db_drop_and_create_all()
 
 ## ROUTES
+
+'''
+menu_response(representation, serializer, cache_control)
+    answers a menu read from the versioned menu_cache
+    the response carries a strong ETag derived from the menu version, a
+    request whose If-None-Match matches gets a 304 without querying the
+    drinks table or serializing anything
+'''
+def menu_response(representation, serializer, cache_control):
+    version = MenuVersion.current()
+    etag = MenuCache.etag(representation, version)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = menu_cache.get(representation, version)
+        if body is None:
+            drinks = Drink.query.order_by(Drink.id).all()
+            body = menu_cache.render(representation, version, serializer(drinks))
+        response = Response(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 '''
 @TODO implement endpoint
     GET /drinks
@@ -27,6 +55,9 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks')
+def get_drinks():
+    return menu_response('short', Drink.bulk_short, 'no-cache')
 
 
 '''
@@ -37,6 +68,10 @@ CORS(app)
     returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
         or appropriate status code indicating reason for failure
 '''
+@app.route('/drinks-detail')
+@requires_auth('get:drinks-detail')
+def get_drinks_detail(payload):
+    return menu_response('long', Drink.bulk_long, 'private, no-cache')
 
 
 '''
@@ -102,9 +137,23 @@ def unprocessable(error):
 @TODO implement error handler for 404
     error handler should conform to general task above 
 '''
+@app.errorhandler(404)
+def not_found(error):
+    return jsonify({
+                    "success": False, 
+                    "error": 404,
+                    "message": "resource not found"
+                    }), 404
 
 
 '''
 @TODO implement error handler for AuthError
     error handler should conform to general task above 
 '''
+@app.errorhandler(AuthError)
+def auth_error(error):
+    return jsonify({
+                    "success": False, 
+                    "error": error.status_code,
+                    "message": error.error['description']
+                    }), error.status_code
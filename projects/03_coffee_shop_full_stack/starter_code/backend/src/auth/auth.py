@@ -2,13 +2,41 @@ import json
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSCache, JWKSUnavailable, url_fetcher
+from .token_cache import TokenCache
 
 
 AUTH0_DOMAIN = 'udacity-fsnd.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'dev'
 
+'''
+jwks_cache
+    process-wide cache of the Auth0 signing keys
+    keys are fetched once and then served from memory, see JWKSCache
+'''
+jwks_cache = JWKSCache(url_fetcher(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'))
+
+'''
+set_jwks_fetcher(fetcher)
+    swaps the source of the signing keys and drops the cached ones
+    EXAMPLE
+        set_jwks_fetcher(file_fetcher('tests/jwks.json'))
+'''
+def set_jwks_fetcher(fetcher):
+    jwks_cache.fetcher = fetcher
+    jwks_cache.clear()
+    token_cache.clear()
+
+'''
+token_cache
+    process-wide LRU of verified tokens used by requires_auth
+    a token is only verified once, until it expires or is evicted
+    token_cache.hits and token_cache.misses report how effective it is
+'''
+token_cache = TokenCache(maxsize=1024)
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -20,6 +48,34 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## Payload
+'''
+Payload
+a decoded jwt payload, behaves like the plain dict returned by jwt.decode
+
+    the permissions claim is compiled once into permission_set (a frozenset)
+    when the token is verified, so the set travels with the payload in
+    token_cache and check_permissions never scans the permissions list
+'''
+class Payload(dict):
+    def __init__(self, claims):
+        super().__init__(claims)
+        self.permission_set = frozenset(claims.get('permissions') or ())
+
+
+'''
+compile_permissions(permission)
+    turns a permission string or an iterable of permission strings into a
+    frozenset, empty strings mean no permission is required
+'''
+def compile_permissions(permission):
+    if not permission:
+        return frozenset()
+    if isinstance(permission, str):
+        return frozenset((permission,))
+    return frozenset(p for p in permission if p)
+
+
 ## Auth Header
 
 '''
@@ -31,21 +87,77 @@ class AuthError(Exception):
     return the token part of the header
 '''
 def get_token_auth_header():
-   raise Exception('Not Implemented')
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
 
 '''
 @TODO implement check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink'), or an iterable /
+            frozenset of permissions (see compile_permissions)
         payload: decoded jwt payload
+        match: 'all' (every permission is required) or 'any' (one is enough)
 
     it should raise an AuthError if permissions are not included in the payload
         !!NOTE check your RBAC settings in Auth0
     it should raise an AuthError if the requested permission string is not in the payload permissions array
     return true otherwise
+
+    the check is a set operation on the payload permission_set, its cost
+    depends on the number of requested permissions, not on how many scopes
+    the token carries
 '''
-def check_permissions(permission, payload):
-    raise Exception('Not Implemented')
+def check_permissions(permission, payload, match='all'):
+    if 'permissions' not in payload:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Permissions not included in JWT.'
+        }, 400)
+
+    required = permission if isinstance(permission, frozenset) else compile_permissions(permission)
+    if not required:
+        return True
+
+    granted = getattr(payload, 'permission_set', None)
+    if granted is None:
+        granted = frozenset(payload['permissions'])
+
+    if match == 'any':
+        allowed = not granted.isdisjoint(required)
+    else:
+        allowed = required <= granted
+
+    if not allowed:
+        raise AuthError({
+            'code': 'unauthorized',
+            'description': 'Permission not found.'
+        }, 403)
+    return True
 
 '''
 @TODO implement verify_decode_jwt(token) method
@@ -59,27 +171,101 @@ def check_permissions(permission, payload):
     return the decoded payload
 
     !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
+    !!NOTE the keys come from jwks_cache, Auth0 is only contacted on the first
+        request, when the cached keys go stale and when a kid is unknown
 '''
 def verify_decode_jwt(token):
-    raise Exception('Not Implemented')
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 401)
+
+    if 'kid' not in unverified_header:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization malformed.'
+        }, 401)
+
+    try:
+        key = jwks_cache.get_key(unverified_header['kid'])
+    except JWKSUnavailable:
+        raise AuthError({
+            'code': 'jwks_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 401)
+    if key is None:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
+
+    rsa_key = {
+        'kty': key['kty'],
+        'kid': key['kid'],
+        'use': key['use'],
+        'n': key['n'],
+        'e': key['e']
+    }
+    try:
+        claims = jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer='https://' + AUTH0_DOMAIN + '/'
+        )
+
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+    return Payload(claims)
 
 '''
 @TODO implement @requires_auth(permission) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permission: string permission (i.e. 'post:drink') or a list of them
+        match: 'all' or 'any', how a list of permissions is checked
+    EXAMPLE
+        @requires_auth(['patch:drinks', 'delete:drinks'], match='any')
 
     it should use the get_token_auth_header method to get the token
     it should use the verify_decode_jwt method to decode the jwt
+        (tokens already verified are served from token_cache)
     it should use the check_permissions method validate claims and check the requested permission
     return the decorator which passes the decoded payload to the decorated method
 '''
-def requires_auth(permission=''):
+def requires_auth(permission='', match='all'):
+    if match not in ('all', 'any'):
+        raise ValueError("match must be 'all' or 'any'")
+    required = compile_permissions(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload = token_cache.get(token)
+            if payload is None:
+                payload = verify_decode_jwt(token)
+                token_cache.put(token, payload)
+            check_permissions(required, payload, match)
             return f(payload, *args, **kwargs)
 
         return wrapper
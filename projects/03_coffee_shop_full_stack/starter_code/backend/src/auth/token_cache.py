@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+TokenCache
+a bounded LRU of already verified tokens
+
+    maps the sha256 digest of a bearer token to its decoded payload, so a
+    client reusing the same token skips the RS256 signature verification
+    entries expire at the token 'exp' claim (or after max_ttl seconds if that
+    comes first) and the least recently used entry is evicted once maxsize
+    is reached
+    only successfully verified payloads are stored, failures are never cached
+
+    hits and misses count lookups and can be used to size the cache
+'''
+class TokenCache:
+    def __init__(self, maxsize=1024, max_ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.sha256(token).digest()
+
+    '''
+    get(token)
+        returns the cached payload for token or None
+    '''
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if self.clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    '''
+    put(token, payload)
+        stores a verified payload
+        payloads without an 'exp' claim are not cached unless max_ttl is set
+    '''
+    def put(self, token, payload):
+        expires_at = payload.get('exp')
+        if self.max_ttl is not None:
+            ttl_expiry = self.clock() + self.max_ttl
+            expires_at = ttl_expiry if expires_at is None else min(expires_at, ttl_expiry)
+        if expires_at is None or self.maxsize <= 0:
+            return
+
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
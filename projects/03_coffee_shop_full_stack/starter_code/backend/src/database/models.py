@@ -1,24 +1,112 @@
 import os
-from sqlalchemy import Column, String, Integer
+import secrets
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
+from sqlalchemy import Column, String, Integer, event, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+'''
+json_loads
+    orjson is used to parse recipes when it is installed, it is several times
+    faster than the standard library json module which is the fallback
+'''
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
 
 db = SQLAlchemy()
 
+'''
+SQLITE_PROFILES
+    pragmas applied to every new SQLite connection, by profile name
+    'tuned' switches to the write-ahead log so readers never wait for
+        writers, relaxes fsyncs to checkpoints (synchronous=NORMAL is safe in
+        WAL mode), memory maps the file and makes writers wait for a lock
+        instead of failing with "database is locked"
+    'default' leaves SQLite with its rollback journal defaults
+'''
+SQLITE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+}
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    @INPUTS
+        database_path: SQLAlchemy url of the database
+        profile: name of the SQLITE_PROFILES entry applied to connections
+        shared_cache: open the file with SQLite shared cache, connections of
+            one process then share a single page cache
+        pool_size: connections kept open per process, extra connections up
+            to max_overflow are opened under load and closed afterwards
 '''
-def setup_db(app):
+def setup_db(app, database_path=database_path, profile='tuned', shared_cache=False,
+             pool_size=5, max_overflow=10):
+    pragmas = SQLITE_PROFILES[profile]
+    engine_options = {}
+    if database_path.startswith('sqlite:///') and database_path != 'sqlite:///:memory:':
+        connect_args = {
+            'check_same_thread': False,
+            'timeout': pragmas.get('busy_timeout', 5000) / 1000
+        }
+        engine_options = {
+            'poolclass': QueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'connect_args': connect_args
+        }
+        if shared_cache:
+            shared_uri = 'file:{}?cache=shared'.format(database_path[len('sqlite:///'):])
+            engine_options['creator'] = lambda: sqlite3.connect(shared_uri, uri=True, **connect_args)
+
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options
     db.app = app
     db.init_app(app)
 
+    engine = db.get_engine(app)
+    if pragmas and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', sqlite_pragma_listener(pragmas))
+    columns = [column['name'] for column in inspect(engine).get_columns('menu_version')]
+    if columns and 'epoch' not in columns:
+        # a counter from before the epoch, started again
+        MenuVersion.__table__.drop(engine)
+    MenuVersion.__table__.create(engine, checkfirst=True)
+
+'''
+sqlite_pragma_listener(pragmas)
+    returns a connect event listener running PRAGMA statements on every new
+    DBAPI connection of the pool
+'''
+def sqlite_pragma_listener(pragmas):
+    statements = ['PRAGMA {}={}'.format(name, value) for name, value in pragmas.items()]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+    return set_pragmas
+
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
@@ -29,6 +117,76 @@ def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
 
+'''
+unit_of_work()
+    groups model changes into one transaction that is committed once
+    insert(), update() and delete() called inside the block do not commit,
+    the whole block is committed when it exits or rolled back on error
+    blocks can be nested, only the outermost one commits
+    EXAMPLE
+        with unit_of_work():
+            for drink in drinks:
+                drink.insert()
+'''
+@contextmanager
+def unit_of_work():
+    session = db.session
+    depth = session.info.get('unit_of_work', 0)
+    session.info['unit_of_work'] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info['unit_of_work'] = depth
+
+'''
+commit()
+    commits the session unless a unit_of_work() is in progress
+'''
+def commit():
+    if not db.session.info.get('unit_of_work'):
+        db.session.commit()
+
+'''
+BulkResult
+    outcome of a bulk_insert() or bulk_delete()
+    succeeded: number of rows written
+    failed: list of (row, error message) for the rows that were rejected
+'''
+BulkResult = namedtuple('BulkResult', ['succeeded', 'failed'])
+
+'''
+bulk_apply(rows, apply, chunk_size)
+    runs apply(chunk) for every chunk of rows inside its own savepoint
+    a chunk that fails is rolled back and replayed row by row, so one bad
+    row only rejects itself and the rest of the batch is still written
+    everything is committed once at the end, see unit_of_work(), callers
+    wrap it in their own unit_of_work() to add changes to the same
+    transaction, like Drink.bulk_insert() bumping the MenuVersion
+'''
+def bulk_apply(rows, apply, chunk_size=1000):
+    succeeded = 0
+    failed = []
+    rows = iter(rows)
+    with unit_of_work() as session:
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            try:
+                with session.begin_nested():
+                    succeeded += apply(chunk)
+            except DBAPIError:
+                for row in chunk:
+                    try:
+                        with session.begin_nested():
+                            succeeded += apply([row])
+                    except DBAPIError as error:
+                        failed.append((row, str(error.orig)))
+    return BulkResult(succeeded, failed)
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -42,13 +200,33 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe =  Column(String(180), nullable=False)
 
+    '''
+    parsed_recipe
+        the recipe blob decoded into a list of ingredient dicts
+        the blob is parsed at most once per recipe value: the parse is kept
+        with the recipe string it came from and redone whenever recipe is
+        assigned or reloaded with a different value
+        every call returns fresh copies, callers may mutate them
+    '''
+    @property
+    def parsed_recipe(self):
+        return [dict(ingredient) for ingredient in self._ingredients()]
+
+    def _ingredients(self):
+        # the cached parse as a tuple, never handed out
+        recipe = self.recipe
+        cached = self.__dict__.get('_parsed_recipe')
+        if cached is None or cached[0] != recipe:
+            cached = (recipe, tuple(json_loads(recipe)))
+            self._parsed_recipe = cached
+        return cached[1]
+
     '''
     short()
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self._ingredients()]
         return {
             'id': self.id,
             'title': self.title,
@@ -63,9 +241,31 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.parsed_recipe
         }
 
+    '''
+    bulk_short(rows) / bulk_long(rows)
+        serialize a whole result set in one pass
+        EXAMPLE
+            drinks = Drink.bulk_short(Drink.query.all())
+    '''
+    @classmethod
+    def bulk_short(cls, rows):
+        return [{
+            'id': drink.id,
+            'title': drink.title,
+            'recipe': [{'color': r['color'], 'parts': r['parts']} for r in drink._ingredients()]
+        } for drink in rows]
+
+    @classmethod
+    def bulk_long(cls, rows):
+        return [{
+            'id': drink.id,
+            'title': drink.title,
+            'recipe': drink.parsed_recipe
+        } for drink in rows]
+
     '''
     insert()
         inserts a new model into a database
@@ -77,7 +277,8 @@ class Drink(db.Model):
     '''
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        MenuVersion.bump()
+        commit()
 
     '''
     delete()
@@ -89,7 +290,8 @@ class Drink(db.Model):
     '''
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        MenuVersion.bump()
+        commit()
 
     '''
     update()
@@ -101,7 +303,92 @@ class Drink(db.Model):
             drink.update()
     '''
     def update(self):
-        db.session.commit()
+        MenuVersion.bump()
+        commit()
+
+    '''
+    bulk_insert(rows)
+        inserts drinks in batches with one commit and one menu version bump
+        rows are Drink instances or dicts of column values
+        returns a BulkResult, e.g. drinks rejected for a duplicate title
+        EXAMPLE
+            Drink.bulk_insert([{'title': 'Latte', 'recipe': json.dumps(recipe)}])
+    '''
+    @classmethod
+    def bulk_insert(cls, rows, chunk_size=1000):
+        def apply(chunk):
+            mappings = [row for row in chunk if isinstance(row, dict)]
+            objects = [row for row in chunk if not isinstance(row, dict)]
+            if mappings:
+                db.session.bulk_insert_mappings(cls, mappings)
+            if objects:
+                db.session.bulk_save_objects(objects)
+            return len(chunk)
+        with unit_of_work():
+            MenuVersion.bump()
+            return bulk_apply(rows, apply, chunk_size)
+
+    '''
+    bulk_delete(ids)
+        deletes drinks by id with set based DELETE statements and one commit
+        returns a BulkResult, ids that do not exist are not counted
+    '''
+    @classmethod
+    def bulk_delete(cls, ids, chunk_size=1000):
+        def apply(chunk):
+            return cls.query.filter(cls.id.in_(chunk)).delete(synchronize_session=False)
+        with unit_of_work():
+            MenuVersion.bump()
+            return bulk_apply(ids, apply, chunk_size)
 
     def __repr__(self):
-        return json.dumps(self.short())
\ No newline at end of file
+        return json.dumps(self.short())
+
+'''
+MenuVersion
+a single row counter of changes to the drinks menu
+
+    every Drink insert, update and delete increments it in the same
+    transaction as the change, so all worker processes sharing the database
+    agree on the current version of the menu
+    the row also holds a random epoch drawn when it is created: versions
+    start over when the menu is recreated with db_drop_and_create_all(),
+    the epoch makes sure "<epoch>.<version>" is never reused anyway
+'''
+class MenuVersion(db.Model):
+    __tablename__ = 'menu_version'
+
+    id = Column(Integer, primary_key=True)
+    epoch = Column(String(16), nullable=False)
+    version = Column(Integer, nullable=False)
+
+    # upserts of the single row, for SQLite (3.24+) and Postgres
+    CREATE = text('INSERT INTO menu_version (id, epoch, version) VALUES (1, :epoch, 0) '
+                  'ON CONFLICT (id) DO NOTHING')
+    BUMP = text('INSERT INTO menu_version (id, epoch, version) VALUES (1, :epoch, 1) '
+                'ON CONFLICT (id) DO UPDATE SET version = menu_version.version + 1')
+
+    '''
+    current()
+        returns the current menu version as "<epoch>.<version>", creating
+        the counter if needed
+    '''
+    @classmethod
+    def current(cls):
+        row = db.session.query(cls.epoch, cls.version).filter(cls.id == 1).first()
+        if row is None:
+            # a no-op when another worker created the counter first
+            db.session.execute(cls.CREATE, {'epoch': secrets.token_hex(8)})
+            db.session.commit()
+            row = db.session.query(cls.epoch, cls.version).filter(cls.id == 1).first()
+        return '{}.{}'.format(*row)
+
+    '''
+    bump()
+        increments the version inside the current session transaction,
+        creating the counter if needed
+        the caller is responsible for the commit
+    '''
+    @classmethod
+    def bump(cls):
+        db.session.execute(cls.BUMP, {'epoch': secrets.token_hex(8)})
@@ -0,0 +1,56 @@
+import json
+import threading
+
+
+'''
+MenuCache
+rendered JSON bodies of the drinks menu, one per representation
+
+    entries are tagged with the MenuVersion they were rendered from and are
+    only served while that version is current, so a change committed by any
+    worker process invalidates every worker's cache on its next request
+'''
+class MenuCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    '''
+    etag(representation, version)
+        strong entity tag of a rendered menu, e.g. "drinks-short-3f9a0c1e5b7d2a64.42"
+    '''
+    @staticmethod
+    def etag(representation, version):
+        return 'drinks-{}-{}'.format(representation, version)
+
+    '''
+    get(representation, version)
+        returns the cached body (bytes) or None if it is missing or outdated
+    '''
+    def get(self, representation, version):
+        entry = self._entries.get(representation)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        return None
+
+    '''
+    render(representation, version, drinks)
+        serializes and stores the response body for a list of drinks
+        the entry is replaced whenever version differs from the cached one:
+        versions of different epochs do not compare, and a body rendered
+        from an older version is only ever a miss, never served stale
+    '''
+    def render(self, representation, version, drinks):
+        body = json.dumps({
+            'success': True,
+            'drinks': drinks
+        }).encode('utf-8')
+        with self._lock:
+            current = self._entries.get(representation)
+            if current is None or current[0] != version:
+                self._entries[representation] = (version, body)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()